@@ -0,0 +1,44 @@
+import argparse, sys
+
+from benchmarks.report import Report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks', description = 'Runs the offline benchmarks and writes a json report')
+    parser.add_argument('suites', nargs = '*', help = 'benchmark suites to run: dispatch, music, memory and/or load (defaults to dispatch, music and memory)')
+    parser.add_argument('-o', '--output', default = 'benchmark.json', help = 'path of the json report')
+    parser.add_argument('-c', '--compare', default = None, help = 'report of an earlier run, exits with 1 on regressions')
+    parser.add_argument('-t', '--tolerance', type = float, default = 0.2, help = 'relative slowdown or growth counted as regression')
+    parser.add_argument('--guilds', type = int, default = 100, help = 'amount of synthetic guilds')
+    parser.add_argument('--members', type = int, default = 100, help = 'amount of synthetic members per guild')
+    parser.add_argument('--events', type = int, default = 20000, help = 'amount of events per dispatch benchmark')
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 10000], help = 'library sizes of the music benchmarks, up to 1000000')
+    parser.add_argument('--objects', type = int, default = 100000, help = 'amount of objects per memory benchmark')
+    parser.add_argument('--rate', type = float, default = 500.0, help = 'messages per second sent by the fake gateway in the load benchmark')
+    parser.add_argument('--workers', type = int, default = 0, help = 'serve the load benchmark through the per-server scheduler with this many workers')
+    parser.add_argument('--searches', type = int, default = 20, help = 'amount of searches per library size')
+    args = parser.parse_args()
+    suites = args.suites or ['dispatch', 'music', 'memory']
+    if any(suite not in ('dispatch', 'music', 'memory', 'load') for suite in suites): parser.error(f'unknown suite in {suites}')
+
+    report = Report()
+    if 'dispatch' in suites:
+        from benchmarks import dispatch
+        dispatch.run(report, guilds = args.guilds, members = args.members, events = args.events)
+    if 'music' in suites:
+        from benchmarks import music
+        music.run(report, sizes = args.sizes, searches = args.searches)
+    if 'memory' in suites:
+        from benchmarks import memory
+        memory.run(report, objects = args.objects)
+    if 'load' in suites:
+        from benchmarks import load
+        load.run(report, messages = args.events, rate = args.rate, workers = args.workers)
+
+    report.save(args.output)
+    print(f'Report written to {args.output}')
+
+    if args.compare is not None:
+        regressions = report.compare(args.compare, tolerance = args.tolerance)
+        for regression in regressions:
+            print(f'Regression {regression}')
+        sys.exit(1 if regressions else 0)
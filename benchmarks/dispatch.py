@@ -0,0 +1,88 @@
+import os, tempfile
+
+from core.client import Client
+from core.config import Configuration
+from core.database import Database
+from core.enums import Event
+
+from benchmarks.report import Report
+from benchmarks.synthetic import World
+
+
+def offline_client(directory : str, **options) -> Client:
+    """
+    Builds a client with handlers registered like a real bot, without logging in
+    """
+    path = os.path.join(directory, 'config.yml')
+    Configuration.generate_template(path)
+    client = Client(config = Configuration(path), **options)
+    client._database = Database(os.path.join(directory, '.sqlite'))
+
+    @client.react(Event.ON_COMMAND, 'ping')
+    async def ping_command(message, *args):
+        await message.channel.send('Pong!')
+
+    @client.react(Event.ON_MESSAGE)
+    async def before_command(message):
+        pass
+
+    @client.react(Event.ON_MESSAGE, after_command = True)
+    async def after_command(message):
+        pass
+
+    @client.react(Event.ON_REACTION_ADD)
+    async def reaction_added(payload):
+        pass
+
+    return client
+
+
+def run(report : Report, guilds : int = 100, members : int = 100, events : int = 20000) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        client = offline_client(directory)
+        world = World(guilds, members)
+        loop = client.loop
+
+        def populate():
+            for guild in world.guilds:
+                server = client.retrieve_server(guild.id)
+                for member in guild.members:
+                    server.retrieve_member(member.id)
+            return client.servers
+
+        report.memory(f'registry.populate[{guilds}x{members}]', populate, objects = guilds * members)
+
+        def dispatch(messages):
+            async def feed():
+                for message in messages:
+                    await client.on_message(message)
+            return lambda: loop.run_until_complete(feed())
+
+        plain = world.messages(['hello there', 'how is everyone doing'], events)
+        report.throughput(f'on_message.plain[{guilds}x{members}]', dispatch(plain), events)
+
+        commands = world.messages([f'{client.prefix}ping'], events)
+        report.throughput(f'on_message.command[{guilds}x{members}]', dispatch(commands), events)
+
+        unknown = world.messages([f'{client.prefix}unknown command'], events)
+        report.throughput(f'on_message.unknown_command[{guilds}x{members}]', dispatch(unknown), events)
+
+        reactions = world.reactions(plain)
+        async def react():
+            for payload in reactions:
+                await client.on_raw_reaction_add(payload)
+        report.throughput(f'on_raw_reaction_add[{guilds}x{members}]', lambda: loop.run_until_complete(react()), events)
+
+        # Reaction roles register a handler per tracked message, lookups stay constant however many there are
+        async def reaction_role(payload):
+            pass
+        for message in plain[::2]:
+            client.react(Event.ON_REACTION_ADD, message = message.id, emoji = '👍')(reaction_role)
+        report.throughput(f'on_raw_reaction_add.tracked[{len(plain[::2])}]', lambda: loop.run_until_complete(react()), events)
+
+        async def process():
+            for message in plain:
+                await client.events.process(Event.ON_MESSAGE, message, False)
+        report.throughput(f'events.process[{guilds}x{members}]', lambda: loop.run_until_complete(process()), events)
+
+        client.database.connection.close()
@@ -0,0 +1,235 @@
+import asyncio, itertools, json, random, threading, time
+
+import discord
+from aiohttp import web
+
+from benchmarks.synthetic import snowflake
+
+
+class Call:
+    """
+    An outbound REST call the bot made
+    """
+
+    def __init__(self, kind : str, channel_id : int, content : str = None, reference : int = None):
+        self.kind : str = kind
+        self.channel_id : int = channel_id
+        self.content : str = content
+        self.reference : int = reference
+        self.time : float = time.perf_counter()
+
+
+class FakeDiscord:
+    """
+    Local stand-in for the discord gateway and REST api, running on its own event loop in a background thread
+    """
+
+    def __init__(self, guilds : int = 2, channels : int = 2, members : int = 50, host : str = '127.0.0.1', seed : int = 0):
+        self._host : str = host
+        self._port : int = None
+        self._random : random.Random = random.Random(seed)
+        self._sequence : itertools.count = itertools.count(1)
+        self._loop : asyncio.AbstractEventLoop = None
+        self._thread : threading.Thread = None
+        self._runner : web.AppRunner = None
+        self._started : threading.Event = threading.Event()
+        self._sockets : list[web.WebSocketResponse] = []
+        self._identified : asyncio.Event = None
+
+        self.user : dict = self.user_payload(snowflake(), 'fake bot', bot = True)
+        self.guilds : list[dict] = [self.guild_payload(channels, members) for _ in range(guilds)]
+        self.calls : list[Call] = []
+        self.dispatched : dict[int, float] = {}
+        self.messages : list[dict] = []
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        return self._loop
+
+    @property
+    def url(self) -> str:
+        return f'http://{self._host}:{self._port}'
+
+    @property
+    def api(self) -> str:
+        return f'{self.url}/api/v7'
+
+    @staticmethod
+    def user_payload(user_id : int, name : str, bot : bool = False) -> dict:
+        return {'id': str(user_id), 'username': name, 'discriminator': '0001', 'avatar': None, 'bot': bot}
+
+    def guild_payload(self, channels : int, members : int) -> dict:
+        guild_id = snowflake()
+        return {
+            'id': str(guild_id),
+            'name': f'guild {guild_id}',
+            'owner_id': self.user['id'],
+            'member_count': members,
+            'large': False,
+            'unavailable': False,
+            'features': [],
+            'emojis': [],
+            'presences': [],
+            'voice_states': [],
+            'members': [],
+            'roles': [{'id': str(guild_id), 'name': '@everyone', 'permissions': '104324673', 'position': 0, 'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': str(snowflake()), 'type': 0, 'name': f'channel {index}', 'position': index, 'permission_overwrites': [], 'nsfw': False} for index in range(channels)],
+            '_members': [self.user_payload(snowflake(), f'member {index}') for index in range(members)]
+        }
+
+    def message_payload(self, channel_id : int, guild_id : int, author : dict, content : str, reference : dict = None) -> dict:
+        payload = {
+            'id': str(snowflake()),
+            'channel_id': str(channel_id),
+            'guild_id': str(guild_id) if guild_id else None,
+            'author': author,
+            'member': {'roles': [], 'joined_at': '2020-01-01T00:00:00+00:00', 'deaf': False, 'mute': False},
+            'content': content,
+            'type': 0,
+            'tts': False,
+            'pinned': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': [],
+            'embeds': [],
+            'timestamp': '2020-01-01T00:00:00+00:00',
+            'edited_timestamp': None
+        }
+        if reference is not None: payload['message_reference'] = reference
+        return payload
+
+    def start(self) -> "FakeDiscord":
+        self._thread = threading.Thread(target = self._serve, name = 'fake-discord')
+        self._thread.daemon = True
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self) -> None:
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def patch(self) -> str:
+        """
+        Points discord.py at this server, returns the previous api base
+        """
+        previous = discord.http.Route.BASE
+        discord.http.Route.BASE = self.api
+        return previous
+
+    def _serve(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._identified = asyncio.Event()
+
+        app = web.Application()
+        app.router.add_get('/api/v7/gateway', self._get_gateway)
+        app.router.add_get('/api/v7/gateway/bot', self._get_gateway)
+        app.router.add_get('/api/v7/users/@me', self._get_me)
+        app.router.add_post('/api/v7/channels/{channel_id}/messages', self._create_message)
+        app.router.add_post('/api/v7/channels/{channel_id}/typing', self._trigger_typing)
+        app.router.add_get('/gateway', self._gateway)
+
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self._host, 0)
+        self._loop.run_until_complete(site.start())
+        self._port = site._server.sockets[0].getsockname()[1]
+
+        self._started.set()
+        self._loop.run_forever()
+
+    @staticmethod
+    def _json(data : dict) -> web.Response:
+        # discord.py only decodes bodies with exactly this content type, without a charset
+        return web.Response(body = json.dumps(data).encode(), headers = {'Content-Type': 'application/json'})
+
+    async def _get_gateway(self, request : web.Request) -> web.Response:
+        return self._json({'url': f'ws://{self._host}:{self._port}/gateway', 'shards': 1})
+
+    async def _get_me(self, request : web.Request) -> web.Response:
+        return self._json(self.user)
+
+    async def _create_message(self, request : web.Request) -> web.Response:
+        body = await request.json()
+        reference = (body.get('message_reference') or {}).get('message_id')
+        channel_id = int(request.match_info['channel_id'])
+        self.calls.append(Call('reply' if reference else 'send', channel_id, body.get('content'), int(reference) if reference else None))
+        guild_id = next((guild['id'] for guild in self.guilds if any(channel['id'] == str(channel_id) for channel in guild['channels'])), None)
+        return self._json(self.message_payload(channel_id, guild_id, self.user, body.get('content', ''), body.get('message_reference')))
+
+    async def _trigger_typing(self, request : web.Request) -> web.Response:
+        self.calls.append(Call('typing', int(request.match_info['channel_id'])))
+        return web.Response(status = 204)
+
+    async def _gateway(self, request : web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        await socket.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': 41250}, 's': None, 't': None}))
+
+        async for message in socket:
+            data = json.loads(message.data)
+            match data['op']:
+                case 1:
+                    await socket.send_str(json.dumps({'op': 11, 'd': None, 's': None, 't': None}))
+                case 2:
+                    await self._dispatch(socket, 'READY', {
+                        'v': 6,
+                        'user': self.user,
+                        'session_id': 'fake',
+                        'guilds': [{'id': guild['id'], 'unavailable': True} for guild in self.guilds],
+                        'private_channels': [],
+                        'relationships': []
+                    })
+                    for guild in self.guilds:
+                        await self._dispatch(socket, 'GUILD_CREATE', {key: value for key, value in guild.items() if not key.startswith('_')})
+                    self._sockets.append(socket)
+                    self._identified.set()
+
+        if socket in self._sockets: self._sockets.remove(socket)
+        return socket
+
+    async def _dispatch(self, socket : web.WebSocketResponse, event : str, data : dict) -> None:
+        await socket.send_str(json.dumps({'op': 0, 't': event, 's': next(self._sequence), 'd': data}))
+
+    async def flood(self, messages : int, rate : float, content : str = '.echo', reactions : float = 0.0) -> float:
+        """
+        Dispatches ``messages`` MESSAGE_CREATE events at ``rate`` per second, a share of ``reactions`` is followed by a REACTION_ADD
+        Returns the seconds it took to send them
+        """
+        await self._identified.wait()
+        socket = self._sockets[-1]
+        channels = [(guild, channel) for guild in self.guilds for channel in guild['channels']]
+
+        start = time.perf_counter()
+        for index in range(messages):
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0: await asyncio.sleep(delay)
+
+            guild, channel = channels[index % len(channels)]
+            author = guild['_members'][self._random.randrange(len(guild['_members']))]
+            payload = self.message_payload(channel['id'], guild['id'], author, f'{content} {index}')
+            self.dispatched[int(payload['id'])] = time.perf_counter()
+            self.messages.append(payload)
+            await self._dispatch(socket, 'MESSAGE_CREATE', payload)
+
+            if reactions and self._random.random() < reactions:
+                target = self.messages[self._random.randrange(len(self.messages))]
+                await self._dispatch(socket, 'MESSAGE_REACTION_ADD', {
+                    'user_id': author['id'],
+                    'channel_id': target['channel_id'],
+                    'message_id': target['id'],
+                    'guild_id': target['guild_id'],
+                    'emoji': {'id': None, 'name': '👍'},
+                    'member': {'user': author, 'roles': [], 'joined_at': '2020-01-01T00:00:00+00:00', 'deaf': False, 'mute': False}
+                })
+
+        return time.perf_counter() - start
+
+    def latencies(self) -> list[float]:
+        """
+        Seconds between dispatching a message and receiving the reply to it
+        """
+        return sorted(call.time - self.dispatched[call.reference] for call in self.calls if call.reference in self.dispatched)
@@ -0,0 +1,65 @@
+import asyncio, tempfile, time
+
+import discord
+
+from core.enums import Event
+from core.event import Scheduler
+
+from benchmarks.dispatch import offline_client
+from benchmarks.fake_discord import FakeDiscord
+from benchmarks.report import Report
+
+
+def percentile(values : list[float], q : float) -> float:
+    if not values: return float('nan')
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+def run(report : Report, messages : int = 2000, rate : float = 500.0, reactions : float = 0.1, guilds : int = 2, channels : int = 2, workers : int = 0, timeout : float = 30.0) -> None:
+    """
+    Runs the real ``Client.run`` against a local fake discord and measures replies end to end
+    With ``workers`` the events are served by the per-server scheduler instead of inline
+    """
+    fake = FakeDiscord(guilds = guilds, channels = channels).start()
+    previous = fake.patch()
+
+    with tempfile.TemporaryDirectory() as directory:
+        client = offline_client(directory, guild_ready_timeout = 0.1)
+        if workers: client.events.scheduler = Scheduler(client, workers = workers)
+
+        @client.react(Event.ON_COMMAND, 'echo')
+        async def echo_command(message, *args):
+            await message.reply(' '.join(args))
+
+        async def drive():
+            await client.wait_until_ready()
+            flooded = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(fake.flood(messages, rate, content = f'{client.prefix}echo', reactions = reactions), fake.loop))
+
+            # Wait until every message got its reply or the timeout passed
+            deadline = time.perf_counter() + timeout
+            while len(fake.latencies()) < messages and time.perf_counter() < deadline:
+                await asyncio.sleep(0.05)
+
+            latencies = fake.latencies()
+            replies = [call for call in fake.calls if call.kind == 'reply']
+            elapsed = (max(call.time for call in replies) - min(fake.dispatched.values())) if replies else float('nan')
+            report.add(
+                f'load.end_to_end[{messages}@{rate:.0f}/s{f",{workers} workers" if workers else ""}]',
+                messages = messages,
+                flood_seconds = flooded,
+                replies = len(latencies),
+                typing = sum(call.kind == 'typing' for call in fake.calls),
+                per_second = len(latencies) / elapsed if replies else 0.0,
+                p50_latency_ms = percentile(latencies, 0.5) * 1000,
+                p99_latency_ms = percentile(latencies, 0.99) * 1000,
+                max_latency_ms = latencies[-1] * 1000 if latencies else float('nan')
+            )
+            await client.close()
+
+        client.loop.create_task(drive())
+        try:
+            client.run()
+        finally:
+            client.database.connection.close()
+            discord.http.Route.BASE = previous
+            fake.stop()
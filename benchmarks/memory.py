@@ -0,0 +1,30 @@
+import os, tempfile, uuid
+
+from core.member import Member
+from core.music import Playlist, Track
+from core.server import Server
+from core.user import User
+
+from benchmarks.report import Report
+from benchmarks.synthetic import snowflake
+
+
+def run(report : Report, objects : int = 100000) -> None:
+    """
+    Bytes retained per member, user, track and playlist, compare reports to see the effect of layout changes
+    """
+    server = Server(None, snowflake())
+    report.memory(f'memory.user[{objects}]', lambda: [User(snowflake()) for _ in range(objects)], objects = objects)
+    users = [User(snowflake()) for _ in range(objects)]
+    report.memory(f'memory.member[{objects}]', lambda: [Member(user, server) for user in users], objects = objects)
+    report.memory(f'memory.user_and_member[{objects}]', lambda: [Member(User(snowflake()), server) for _ in range(objects)], objects = objects)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Every track hashes its file, a single tiny file keeps the benchmark about the objects
+        path = os.path.join(directory, 'track.mp3')
+        with open(path, 'wb') as outfile:
+            outfile.write(b'\0' * 64)
+
+        tracks = report.memory(f'memory.track[{objects}]', lambda: [Track(f'track {index}', path, '', uuid.uuid4()) for index in range(objects)], objects = objects)
+        size = 100
+        report.memory(f'memory.playlist[{objects // size}x{size}]', lambda: [Playlist(f'playlist {index}', '', tracks[index * size:(index + 1) * size]) for index in range(objects // size)], objects = objects // size)
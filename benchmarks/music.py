@@ -0,0 +1,70 @@
+import json, os, random, tempfile, uuid
+
+from core.music import Music
+
+from benchmarks.report import Report
+
+WORDS : list[str] = ['love', 'night', 'summer', 'heart', 'fire', 'dream', 'rain', 'blue', 'road', 'light', 'dance', 'gold', 'river', 'storm', 'wild', 'home', 'stars', 'echo', 'city', 'ghost']
+
+
+def generate_library(path : str, size : int, files : int = 16, seed : int = 0) -> list[str]:
+    """
+    Writes an index with ``size`` tracks which share a few small audio files, returns the track names
+    """
+    generator = random.Random(seed)
+    sources = []
+    for index in range(files):
+        source = os.path.join(path, f'track_{index}.mp3')
+        with open(source, 'wb') as outfile:
+            outfile.write(generator.randbytes(4096))
+        sources.append(source)
+
+    names = [f'{" ".join(generator.choices(WORDS, k = 3))} {index}' for index in range(size)]
+    tracks = [
+        {
+            'reference': uuid.UUID(int = generator.getrandbits(128)).hex,
+            'name': name,
+            'description': '',
+            'path': sources[index % files],
+            # Stored like a scanned index, the files are not hashed again on read
+            'checksum': f'{index:032x}'
+        }
+        for index, name in enumerate(names)
+    ]
+    playlist = {
+        'reference': uuid.UUID(int = generator.getrandbits(128)).hex,
+        'name': 'generated',
+        'description': f'{size} generated tracks',
+        'tracks': [track['reference'] for track in tracks]
+    }
+
+    # Same location ``Music.read`` looks for the index
+    with open(f'{path}\\index.json', 'w') as index_file:
+        json.dump({'playlists': [playlist], 'tracks': tracks}, index_file)
+    return names
+
+
+def run(report : Report, sizes : list[int] = (1000, 10000), searches : int = 20, seed : int = 0) -> None:
+    generator = random.Random(seed)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            names = generate_library(directory, size, seed = seed)
+
+            def load():
+                music = Music()
+                music.read(directory)
+                return music
+
+            music = report.memory(f'music.read[{size}]', load, objects = size)
+
+            exact = generator.sample(names, min(searches, size))
+            report.throughput(f'music.search_track.exact[{size}]', lambda: [music.search_track(query) for query in exact], len(exact))
+
+            fuzzy = [' '.join(query.split(' ')[:2]) for query in exact]
+            # Without the cache every repetition matches against the whole library again
+            music.cache_size = 0
+            report.throughput(f'music.search_track.fuzzy.uncached[{size}]', lambda: [music.search_track(query) for query in fuzzy], len(fuzzy))
+            music.cache_size = 1024
+            report.throughput(f'music.search_track.fuzzy[{size}]', lambda: [music.search_track(query) for query in fuzzy], len(fuzzy))
+
+            if os.path.exists(f'{directory}\\index.json'): os.remove(f'{directory}\\index.json')
@@ -0,0 +1,81 @@
+import gc, json, platform, time, tracemalloc
+
+from typing import Callable
+
+
+class Report:
+    """
+    Machine readable collection of benchmark results
+    """
+
+    def __init__(self):
+        self._results : dict[str, dict] = {}
+
+    @property
+    def results(self) -> dict[str, dict]:
+        return self._results
+
+    def add(self, name : str, **values) -> dict:
+        self.results[name] = values
+        print(f'{name:<48} ' + ', '.join(f'{key} {value:,.3f}' if isinstance(value, float) else f'{key} {value}' for key, value in values.items()))
+        return values
+
+    def throughput(self, name : str, func : Callable[[], None], operations : int) -> dict:
+        """
+        Runs ``func`` once and records how many of its ``operations`` were done per second
+        """
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        return self.add(name, operations = operations, seconds = seconds, per_second = operations / seconds if seconds else float('inf'))
+
+    def memory(self, name : str, func : Callable[[], object], objects : int = None) -> object:
+        """
+        Runs ``func`` and records the memory retained by its result and the peak while it ran
+        """
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+        gc.collect()
+        retained = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        values = dict(seconds = seconds, retained_bytes = retained, peak_bytes = peak)
+        if objects: values['bytes_per_object'] = retained / objects
+        self.add(name, **values)
+        return result
+
+    def to_dict(self) -> dict:
+        return {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': time.time(),
+            'results': self.results
+        }
+
+    def save(self, path : str) -> None:
+        with open(path, 'w') as outfile:
+            json.dump(self.to_dict(), outfile, indent = 4)
+
+    def compare(self, path : str, tolerance : float = 0.2) -> list[str]:
+        """
+        Lists every result which got more than ``tolerance`` slower or bigger than in the report at ``path``
+        """
+        with open(path, 'r') as infile:
+            baseline = json.load(infile)['results']
+
+        regressions = []
+        for name, values in self.results.items():
+            if name not in baseline: continue
+            old = baseline[name]
+            if 'per_second' in values and 'per_second' in old and values['per_second'] < old['per_second'] * (1 - tolerance):
+                regressions.append(f'{name}: {values["per_second"]:,.1f}/s, was {old["per_second"]:,.1f}/s')
+            for key in ('retained_bytes', 'peak_bytes', 'bytes_per_object'):
+                if key in values and key in old and values[key] > old[key] * (1 + tolerance):
+                    regressions.append(f'{name}: {key} {values[key]:,.0f}, was {old[key]:,.0f}')
+        return regressions
@@ -0,0 +1,151 @@
+import itertools, time
+
+from core.metrics import DISCORD_EPOCH
+
+_counter = itertools.count()
+
+
+def snowflake() -> int:
+    """
+    Unique snowflake carrying the current time, like the ones discord generates
+    """
+    return ((int(time.time() * 1000) - DISCORD_EPOCH) << 22) | (next(_counter) & 0x3FFFFF)
+
+
+class Sent:
+    """
+    Counts outbound calls instead of sending them to discord
+    """
+
+    def __init__(self):
+        self.messages : int = 0
+        self.replies : int = 0
+        self.typing : int = 0
+
+
+class Role:
+
+    def __init__(self, role_id : int, name : str = 'role'):
+        self.id : int = role_id
+        self.name : str = name
+
+
+class User:
+
+    def __init__(self, user_id : int, name : str = 'user', bot : bool = False):
+        self.id : int = user_id
+        self.name : str = name
+        self.bot : bool = bot
+        self.discriminator : str = '0001'
+
+    @property
+    def mention(self) -> str:
+        return f'<@{self.id}>'
+
+    def __eq__(self, other) -> bool:
+        return other is not None and getattr(other, 'id', None) == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+
+class Member(User):
+
+    def __init__(self, user_id : int, guild : "Guild", name : str = 'member', roles : list[Role] = None):
+        super().__init__(user_id, name)
+        self.guild : "Guild" = guild
+        self.roles : list[Role] = roles or []
+        self.voice = None
+
+
+class Guild:
+
+    def __init__(self, guild_id : int, name : str = 'guild'):
+        self.id : int = guild_id
+        self.name : str = name
+        self.voice_client = None
+        self.members : list[Member] = []
+        self.roles : list[Role] = [Role(guild_id, '@everyone')]
+
+
+class TextChannel:
+
+    def __init__(self, channel_id : int, guild : Guild, sent : Sent, nsfw : bool = False):
+        self.id : int = channel_id
+        self.guild : Guild = guild
+        self.nsfw : bool = nsfw
+        self._sent : Sent = sent
+
+    def is_nsfw(self) -> bool:
+        return self.nsfw
+
+    async def send(self, content = None, **kwargs) -> "Message":
+        self._sent.messages += 1
+
+    async def trigger_typing(self) -> None:
+        self._sent.typing += 1
+
+
+class Message:
+
+    def __init__(self, content : str, author : Member, channel : TextChannel):
+        self.id : int = snowflake()
+        self.content : str = content
+        self.author : Member = author
+        self.channel : TextChannel = channel
+        self.guild : Guild = channel.guild
+        self.reactions : list = []
+
+    async def reply(self, content = None, **kwargs) -> "Message":
+        self.channel._sent.replies += 1
+
+
+class ReactionPayload:
+    """
+    Stands in for ``discord.RawReactionActionEvent``
+    """
+
+    def __init__(self, message : Message, member : Member, emoji : str = '👍', event_type : str = 'REACTION_ADD'):
+        self.message_id : int = message.id
+        self.channel_id : int = message.channel.id
+        self.guild_id : int = message.guild.id
+        self.user_id : int = member.id
+        self.member : Member = member
+        self.emoji : str = emoji
+        self.event_type : str = event_type
+
+
+class World:
+    """
+    A generated set of guilds, channels and members to draw synthetic events from
+    """
+
+    def __init__(self, guilds : int, members : int, channels : int = 2):
+        self.sent : Sent = Sent()
+        self.guilds : list[Guild] = []
+        self.channels : list[TextChannel] = []
+        self.members : list[Member] = []
+
+        for _ in range(guilds):
+            guild = Guild(snowflake())
+            self.guilds.append(guild)
+            for _ in range(channels):
+                self.channels.append(TextChannel(snowflake(), guild, self.sent))
+            for _ in range(members):
+                member = Member(snowflake(), guild)
+                guild.members.append(member)
+                self.members.append(member)
+
+    def messages(self, contents : list[str], amount : int) -> list[Message]:
+        channels = len(self.channels)
+        return [
+            Message(
+                content = contents[index % len(contents)],
+                author = self.channels[index % channels].guild.members[index // channels % len(self.channels[index % channels].guild.members)],
+                channel = self.channels[index % channels]
+            )
+            for index in range(amount)
+        ]
+
+    def reactions(self, messages : list[Message]) -> list[ReactionPayload]:
+        return [ReactionPayload(message, message.author) for message in messages]
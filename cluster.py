@@ -0,0 +1,18 @@
+import argparse
+
+from core.cluster import Cluster
+from main import setup
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Runs the bot as a cluster of worker processes, each one serving a contiguous range of shards')
+    parser.add_argument('-w', '--workers', type = int, default = None, help = 'amount of worker processes (defaults to the amount of cpu cores)')
+    parser.add_argument('-s', '--shards', type = int, default = None, help = 'total amount of shards (defaults to the amount of workers)')
+    parser.add_argument('--restart-delay', type = float, default = 5.0, help = 'seconds to wait before restarting a crashed worker')
+    args = parser.parse_args()
+
+    Cluster(
+        factory = setup,
+        workers = args.workers,
+        shard_count = args.shards,
+        restart_delay = args.restart_delay
+    ).run()
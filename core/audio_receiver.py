@@ -1,3 +1,4 @@
+import os, queue, struct, threading, time
 import numpy as np
 import discord
 import grpc
@@ -50,4 +51,209 @@ class BufferAudioSink(discord.AudioSink):
             pcm_s16le = self.buffer.tobytes()
             self.buffer.fill(0)
             self.buffer_pointer = 0
-            self.flush(self.speaker, pcm_s16le, self.SAMPLE_RATE_HZ, self.NUM_CHANNELS)
\ No newline at end of file
+            self.flush(self.speaker, pcm_s16le, self.SAMPLE_RATE_HZ, self.NUM_CHANNELS)
+
+
+
+class SpeakerFile:
+    """
+    Wav file of one speaker, the sizes in the header are filled in when it is closed
+    """
+
+    HEADER = struct.Struct('<4sI4s4sIHHIIHH4sI')
+
+    def __init__(self, path, sample_rate, num_channels):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.bytes = 0
+        self.file = open(path, 'wb')
+        self.file.write(self.header(0))
+
+    def header(self, size):
+        block_align = self.num_channels * 2
+        return self.HEADER.pack(b'RIFF', 36 + size, b'WAVE', b'fmt ', 16, 1, self.num_channels, self.sample_rate, self.sample_rate * block_align, block_align, 16, b'data', size)
+
+    def write(self, view):
+        self.file.write(view)
+        self.bytes += len(view)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(self.header(self.bytes))
+        self.file.close()
+
+
+class RecordingSink(discord.AudioSink):
+    """
+    Streams the audio of every speaker into its own wav file in ``directory``
+    Frames are copied into a fixed pool of buffers which a writer thread empties, so memory stays constant however long it records
+    Recording stops after ``max_seconds`` or ``max_bytes``, frames arriving while the disk lags behind and every buffer is full are dropped
+    """
+
+    def __init__(self, directory, max_seconds = 3600.0, max_bytes = 1 << 30, buffer_frames = 50, buffers = 16, finished = None):
+        self.NUM_CHANNELS = discord.opus.Decoder.CHANNELS
+        self.SAMPLE_RATE_HZ = discord.opus.Decoder.SAMPLING_RATE
+        self.FRAME_SIZE = discord.opus.Decoder.FRAME_SIZE
+        self.directory = directory
+        self.max_seconds = max_seconds
+        # The wav header stores sizes in 32 bits
+        self.max_bytes = min(max_bytes, (1 << 32) - 64)
+        self.finished = finished
+        # Counted from the start, so a recording where nobody speaks still ends
+        self.started = time.monotonic()
+        self.bytes = 0
+        self.dropped = 0
+        self.closed = False
+        self.files = {}
+
+        self._buffer_size = self.FRAME_SIZE * buffer_frames
+        self._free = queue.Queue()
+        for _ in range(buffers):
+            self._free.put(bytearray(self._buffer_size))
+        # speaker id -> (buffer, filled bytes)
+        self._current = {}
+        self._pending = queue.Queue()
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok = True)
+        self._writer = threading.Thread(target = self._write_loop, name = 'recording-writer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def write(self, voice_data):
+        if voice_data.user is None or self.closed: return
+        data = voice_data.data
+
+        with self._lock:
+            if self.closed: return
+            if time.monotonic() - self.started > self.max_seconds or self.bytes + len(data) > self.max_bytes:
+                self._close()
+                return
+
+            speaker = voice_data.user.id
+            buffer, filled = self._current.get(speaker, (None, 0))
+            # Handed to the writer before a frame would overflow it, slice assignment would grow the pooled buffer otherwise
+            if buffer is not None and filled + len(data) > self._buffer_size:
+                self._pending.put((speaker, buffer, filled))
+                self._current.pop(speaker, None)
+                buffer, filled = None, 0
+            if buffer is None:
+                if len(data) > self._buffer_size:
+                    self.dropped += 1
+                    return
+                try:
+                    buffer = self._free.get_nowait()
+                except queue.Empty:
+                    self.dropped += 1
+                    return
+
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self.bytes += len(data)
+            self._current[speaker] = (buffer, filled)
+
+    def _close(self):
+        # Called with the lock held, hands the partly filled buffers and the stop marker to the writer
+        if self.closed: return
+        self.closed = True
+        for speaker, (buffer, filled) in self._current.items():
+            self._pending.put((speaker, buffer, filled))
+        self._current.clear()
+        self._pending.put(None)
+
+    def _write_loop(self):
+        while True:
+            try:
+                item = self._pending.get(timeout = max(0.0, min(1.0, self.started + self.max_seconds - time.monotonic())))
+            except queue.Empty:
+                # Nobody spoke for a while, the time limit is enforced here as no write will notice it
+                if time.monotonic() - self.started > self.max_seconds:
+                    with self._lock:
+                        self._close()
+                continue
+            if item is None: break
+            speaker, buffer, filled = item
+            try:
+                if speaker not in self.files:
+                    self.files[speaker] = SpeakerFile(os.path.join(self.directory, f'{speaker}.wav'), self.SAMPLE_RATE_HZ, self.NUM_CHANNELS)
+                # Written straight from the buffer, without copying it into a bytes object first
+                self.files[speaker].write(memoryview(buffer)[:filled])
+            except OSError as e:
+                print(f'Failed to write the recording of {speaker}: {e}')
+            finally:
+                self._free.put(buffer)
+
+        for speaker_file in self.files.values():
+            speaker_file.close()
+        if self.finished is not None: self.finished(self)
+
+    def cleanup(self):
+        with self._lock:
+            self._close()
+
+
+class DecodedVoiceData:
+    __slots__ = ('user', 'data', 'packet')
+
+    def __init__(self, user, data, packet):
+        self.user = user
+        self.data = data
+        self.packet = packet
+
+
+class SelectiveSink(discord.AudioSink):
+    """
+    Receives opus packets and decodes only the speakers subscribed to, before handing the pcm to ``sink``
+    Packets of everyone else are dropped undecoded, so decoding scales with the subscribers instead of the size of the channel
+    With ``speakers = None`` every speaker is subscribed
+    Subscriptions change from the event loop while the voice thread writes, so each voice client needs a sink of its own
+    """
+
+    def __init__(self, sink, speakers = ()):
+        self.sink = sink
+        self.speakers = None if speakers is None else set(speakers)
+        self.decoded = 0
+        self.skipped = 0
+        # Opus decoding depends on the previous packets, so every speaker keeps its own decoder
+        self._decoders = {}
+        self._lock = threading.Lock()
+
+    def wants_opus(self):
+        return True
+
+    def subscribe(self, speaker):
+        with self._lock:
+            if self.speakers is not None: self.speakers.add(speaker)
+
+    def unsubscribe(self, speaker):
+        with self._lock:
+            if self.speakers is not None: self.speakers.discard(speaker)
+            self._decoders.pop(speaker, None)
+
+    def subscribed(self, speaker):
+        return self.speakers is None or speaker in self.speakers
+
+    def write(self, voice_data):
+        if voice_data.user is None: return
+        speaker = voice_data.user.id
+        # A sink that stopped, like a finished recording, gets nothing decoded anymore
+        if getattr(self.sink, 'closed', False) or not self.subscribed(speaker):
+            self.skipped += 1
+            return
+
+        with self._lock:
+            decoder = self._decoders.get(speaker)
+            if decoder is None: decoder = self._decoders[speaker] = discord.opus.Decoder()
+        try:
+            pcm = decoder.decode(voice_data.data)
+        except discord.opus.OpusError:
+            self.skipped += 1
+            return
+        self.decoded += 1
+        self.sink.write(DecodedVoiceData(voice_data.user, pcm, getattr(voice_data, 'packet', None)))
+
+    def cleanup(self):
+        with self._lock:
+            self._decoders.clear()
+        self.sink.cleanup()
@@ -1,17 +1,27 @@
-import discord
+import discord, os
 
-from typing import Awaitable, Union
+from typing import Awaitable, Callable
 
-from core.config import Configuration
+from core.clips import Clips
+from core.config import Configuration, Snapshot
 from core.console import Console
 from core.enums import Auth, Event, Restriction
-from core.event import Events
+from core.event import Events, Scheduler
+from core.executor import Executors
+from core import memory
+from core.metrics import Metrics, Timeline
+from core.mixer import Mixers
+from core.profiler import LagMonitor, SamplingProfiler
+from core.outbox import Outbox
+from core.prefix import Prefixes
+from core.roles import Roles
+from core.ratelimit import Cooldowns, LoadShedder
 from core.server import Server
 from core.user import User
 from core.database import Database
 from core.thread import ClientThread
 from core.music import Music
-from core.audio_receiver import GoogleSpeechToText, BufferAudioSink
+from core.audio_receiver import GoogleSpeechToText, BufferAudioSink, SelectiveSink
 
 
 class Client(discord.Client):
@@ -19,64 +29,145 @@ class Client(discord.Client):
     Extends the discord.py client
     """
     
-    def __init__(self, config : Configuration = None, music_path : str = None):
-        super().__init__()
+    def __init__(self, config : Configuration = None, music_path : str = None, timeline : Timeline = None, **options):
+        # Options passed explicitly win over the memory profile of the configuration
+        super().__init__(**{**(memory.options(config.memory) if config is not None else {}), **options})
 
         self._config : Configuration = config
+        self._timeline : Timeline = timeline or Timeline()
         self._running : bool = False
         self._users : list[User] = []
         self._servers : list[Server] = []
+        # Indices of the lists above by id, lookups don't scan every known user or server
+        self._users_by_id : dict[int, User] = {}
+        self._servers_by_id : dict[int, Server] = {}
         self._database : Database = None
         self._is_ready : bool = False
         self._thread : ClientThread = None
-        self._transcriber : GoogleSpeechToText = GoogleSpeechToText(
-            recognition_model = 'phone_call', 
-            lang = 'de-DE', 
-            api_credentials = args.google_api_credentials_file
-        )
-        self._audio_sink : BufferAudioSink = BufferAudioSink(self.transcribe)
+        self._transcriber : GoogleSpeechToText = None
+        # Nobody is decoded until they opt in to transcription, every server listens with its own sink
+        self._audio_sinks : dict[int, SelectiveSink] = {}
         
+        self._metrics : Metrics = Metrics()
+        self._lag_monitor : LagMonitor = LagMonitor()
+        self._profiler : SamplingProfiler = SamplingProfiler()
+        self._prefixes : Prefixes = Prefixes(self)
+        self._roles : Roles = Roles(self)
+        self._outbox : Outbox = Outbox(self, **(config.outbox if config is not None else {}))
+        self._cooldowns : Cooldowns = Cooldowns()
+        self._shedder : LoadShedder = LoadShedder(self, **(config.shedding if config is not None else {}))
+        self._executors : Executors = Executors(**(config.executor if config is not None else {}))
         self._events : Events = Events(self)
+        if config is not None and config.scheduler.get('enabled'):
+            self._events.scheduler = Scheduler(self, **{key: value for key, value in config.scheduler.items() if key != 'enabled'})
         
         self._music : Music = Music()
-        if music_path is not None: self.music.read(music_path)
+        self._mixers : Mixers = Mixers()
+        self._clips : Clips = Clips()
+        self._music_path : str = music_path
+        self._metrics.gauge('discord_voice_frames_decoded_total', 'Voice frames of subscribed speakers decoded for transcription', lambda: sum(sink.decoded for sink in list(self._audio_sinks.values())), kind = 'counter')
+        self._metrics.gauge('discord_voice_frames_skipped_total', 'Voice frames of other speakers dropped without decoding', lambda: sum(sink.skipped for sink in list(self._audio_sinks.values())), kind = 'counter')
+        self._metrics.gauge('discord_music_search_cache_hits_total', 'Track searches answered from the cache', lambda: self._music.hits, kind = 'counter')
+        self._metrics.gauge('discord_music_search_cache_misses_total', 'Track searches matched against the library', lambda: self._music.misses, kind = 'counter')
         
         @self.event
         async def on_ready():
             print(f'Sucessfully logged in as {self.user}')
+            if not self._is_ready and self._timeline.finish('login'): print(self._timeline.report())
+            if not self._is_ready: self.export_metrics()
+            if not self._lag_monitor.running: self._lag_monitor.start(self.loop)
+            if not self._cooldowns.running: self._cooldowns.start()
             self._is_ready = True
             
+        async def handle_message(message : discord.Message):
+            if self._events.active(Event.ON_MESSAGE, message, False):
+                await self._events.process(Event.ON_MESSAGE, message, False)
+
+            prefix = self._prefixes.match(message)
+            if prefix is not None:
+                await self._events.process(Event.ON_COMMAND, message, prefix = prefix)
+                
+            if self._events.active(Event.ON_MESSAGE, message, True):
+                await self._events.process(Event.ON_MESSAGE, message, True)
+            
         @self.event
         async def on_message(message : discord.Message):
             if message.author == self.user:
                 return
             
-            await self._events.process(Event.ON_MESSAGE, message, False)
-
-            if message.content.startswith(self.prefix):
-                await self._events.process(Event.ON_COMMAND, message, prefix = self.prefix)
-                
-            await self._events.process(Event.ON_MESSAGE, message, True)
+            self._metrics.observe_snowflake(message.id)
+            # All passes of a message are queued as one, so they keep their order
+            await self._events.dispatch(message.guild.id if message.guild is not None else message.channel.id, handle_message, message)
             
+        # Raw events fire for every message, not only those still in the message cache
         @self.event
-        async def on_reaction_add(reaction : discord.Reaction, user : Union[discord.Member, discord.User]):
-            await self._events.process(Event.ON_REACTION_ADD, reaction, user)
+        async def on_raw_reaction_add(payload : discord.RawReactionActionEvent):
+            if self._events.active(Event.ON_REACTION_ADD):
+                await self._events.dispatch(payload.guild_id or payload.channel_id, self._events.process, Event.ON_REACTION_ADD, payload)
             
-        # @self.event
-        # async def on_reaction_remove(reaction : discord.Reaction, user : Union[discord.Member, discord.User]):
-        #     await self._events.process(Event.ON_REACTION_REMOVE, reaction, user, False)
+        @self.event
+        async def on_raw_reaction_remove(payload : discord.RawReactionActionEvent):
+            if self._events.active(Event.ON_REACTION_REMOVE):
+                # Discord sends no member on removals, it is filled from the cache so scopes can match it
+                if payload.member is None and payload.guild_id is not None:
+                    guild = self.get_guild(payload.guild_id)
+                    payload.member = guild.get_member(payload.user_id) if guild is not None else None
+                await self._events.dispatch(payload.guild_id or payload.channel_id, self._events.process, Event.ON_REACTION_REMOVE, payload)
         
         @self.event
         async def on_member_join(member : discord.Member):
-            await self._events.process(Event.ON_MEMBER_JOIN, member)
+            if self._events.active(Event.ON_MEMBER_JOIN):
+                await self._events.dispatch(member.guild.id, self._events.process, Event.ON_MEMBER_JOIN, member)
             
         @self.event
         async def on_member_remove(member : discord.Member):
-            await self._events.process(Event.ON_MEMBER_REMOVE, member)
+            if self._events.active(Event.ON_MEMBER_REMOVE):
+                await self._events.dispatch(member.guild.id, self._events.process, Event.ON_MEMBER_REMOVE, member)
+            
+        # Only dispatched with the members intent, without it role changes apply once the cache is invalidated otherwise
+        @self.event
+        async def on_member_update(before : discord.Member, after : discord.Member):
+            self._roles.member_updated(before, after)
+            
+        @self.event
+        async def on_guild_role_delete(role : discord.Role):
+            self._roles.role_deleted(role)
                 
         @self.react(Event.ON_COMMAND, 'permission', permission = Auth.DEFAULT)
-        async def retrieve_authorization_command(message : discord.Message):
-            await message.reply(f'Your authorization level is ``{self.retrieve_server(message.guild.id).retrieve_member(message.author.id).permission.name.lower()}``')
+        async def retrieve_authorization_command(message : discord.Message, *args):
+            self.outbox.reply(message, f'Your authorization level is ``{self.roles.permission(message.author).name.lower()}``')
+            
+        @self.react(Event.ON_COMMAND, 'role', permission = Auth.ADMIN)
+        async def change_role_command(message : discord.Message, role : str = "", permission : str = "", *args):
+            role_id = message.role_mentions[0].id if message.role_mentions else role
+            try:
+                role_id = int(role_id)
+                permission = Auth.convert(permission) if permission != 'reset' else Auth.DEFAULT
+            except ValueError:
+                self.outbox.reply(message, f"Usage: ``{self.prefixes.resolve(message.guild.id, message.channel.id)}role <role> <default|moderator|admin|owner|reset>``")
+                return
+            if permission.value > self.roles.permission(message.author).value:
+                self.outbox.reply(message, "You can't grant a higher authorization level than your own.")
+                return
+            self.roles.set(message.guild.id, role_id, permission)
+            self.outbox.reply(message, f"Members with the role ``{role_id}`` have the authorization level ``{permission.name.lower()}``")
+            
+        @self.react(Event.ON_COMMAND, 'prefix', permission = Auth.ADMIN)
+        async def change_prefix_command(message : discord.Message, prefix : str = "", scope : str = "", *args):
+            channel_id = message.channel.id if scope == 'channel' else None
+            if prefix == "":
+                self.outbox.reply(message, f"Usage: ``{self.prefixes.resolve(message.guild.id, message.channel.id)}prefix <prefix|reset> [channel]``")
+                return
+            if prefix == 'reset':
+                self.prefixes.reset(message.guild.id, channel_id)
+                self.outbox.reply(message, f"Reset the prefix of this {scope or 'server'} to ``{self.prefixes.resolve(message.guild.id, message.channel.id)}``")
+                return
+            try:
+                self.prefixes.set(message.guild.id, prefix, channel_id)
+            except ValueError as e:
+                self.outbox.reply(message, str(e))
+                return
+            self.outbox.reply(message, f"Changed the prefix of this {scope or 'server'} to ``{prefix}``")
           
     # For Voice Recognition Feature
     def transcribe(self, speaker, pcm_s16le, sample_rate, num_channels):
@@ -85,12 +176,31 @@ class Client(discord.Client):
         if hyp:
             self.messages.append((speaker, hyp))
           
+    def audio_sink(self, guild_id : int) -> SelectiveSink:
+        """
+        The transcription sink of a server, it keeps the speakers who opted in there across reconnects
+        """
+        sink = self._audio_sinks.get(guild_id)
+        if sink is None: sink = self._audio_sinks[guild_id] = SelectiveSink(BufferAudioSink(self.transcribe))
+        return sink
+          
+    @property
+    def transcriber(self) -> GoogleSpeechToText:
+        # Created on first use, so the client can be constructed without speech credentials
+        if self._transcriber is None:
+            self._transcriber = GoogleSpeechToText(
+                recognition_model = self.config.speech.get('model', 'phone_call'), 
+                lang = self.config.speech.get('lang', 'de-DE'), 
+                api_credentials = self.config.speech.get('credentials')
+            )
+        return self._transcriber
+          
     @property
     def events(self) -> Events:
         return self._events
           
     def react(self, event_type : Event, *args, **kwargs):
-        def decorator(coro : Awaitable[None]):
+        def decorator(coro : Awaitable[None] | Callable):
             self.events.add(
                 coro,
                 event_type,
@@ -102,10 +212,123 @@ class Client(discord.Client):
 
         return decorator
         
+    @property
+    def metrics(self) -> Metrics:
+        return self._metrics
+    
+    @property
+    def prefixes(self) -> Prefixes:
+        return self._prefixes
+    
+    @property
+    def roles(self) -> Roles:
+        return self._roles
+    
+    @property
+    def outbox(self) -> Outbox:
+        return self._outbox
+    
+    @property
+    def executors(self) -> Executors:
+        return self._executors
+    
+    @property
+    def cooldowns(self) -> Cooldowns:
+        return self._cooldowns
+    
+    @property
+    def shedder(self) -> LoadShedder:
+        return self._shedder
+    
+    @property
+    def lag_monitor(self) -> LagMonitor:
+        return self._lag_monitor
+    
+    @property
+    def profiler(self) -> SamplingProfiler:
+        return self._profiler
+    
+    @property
+    def timeline(self) -> Timeline:
+        return self._timeline
+    
+    @property
+    def worker(self) -> int:
+        """
+        Index of the cluster worker running this client, 0 outside of a cluster
+        """
+        return 0
+    
+    def export_metrics(self) -> None:
+        # Workers of a cluster each serve on their own port and write their own file
+        if self.config.metrics.get('port') is not None:
+            self.metrics.serve(self.config.metrics['port'] + self.worker, host = self.config.metrics.get('host', '127.0.0.1'))
+        if self.config.metrics.get('path') is not None:
+            root, extension = os.path.splitext(self.config.metrics['path'])
+            self.metrics.export(f'{root}-{self.worker}{extension}' if self.worker else self.config.metrics['path'], interval = self.config.metrics.get('interval', 15.0))
+        
+    def register_console(self, console : Console) -> Console:
+        """
+        Registers the built-in console commands, without overwriting commands of the same name
+        """
+        if 'metrics' not in console.functions:
+            @console.func('metrics')
+            def print_metrics(*args):
+                print(self.metrics.summary())
+        
+        if 'lag' not in console.functions:
+            @console.func('lag')
+            def lag_monitor(threshold : str = None):
+                if threshold == 'off':
+                    self.lag_monitor.stop()
+                elif threshold == 'on':
+                    if not self.lag_monitor.running: self.lag_monitor.start(self.loop)
+                elif threshold is not None:
+                    try:
+                        self.lag_monitor.threshold = float(threshold) / 1000
+                    except ValueError:
+                        print(f"'{threshold}' is no threshold in milliseconds, use a number, 'on' or 'off'")
+                        return
+                print(f'Lag monitor {"running" if self.lag_monitor.running else "stopped"} (threshold {self.lag_monitor.threshold * 1000:.0f}ms): current lag {self.lag_monitor.lag * 1000:.1f}ms, max lag {self.lag_monitor.max_lag * 1000:.1f}ms, {self.lag_monitor.stalls} stalls, {self.shedder.shed} commands shed')
+        
+        if 'caches' not in console.functions:
+            # Runs on the event loop, so the caches don't change while they are counted
+            @console.func('caches')
+            async def cache_sizes(*args):
+                print(memory.report(self))
+        
+        if 'startup' not in console.functions:
+            @console.func('startup')
+            def startup_timeline(*args):
+                print(self.timeline.report())
+        
+        if 'profile' not in console.functions:
+            @console.func('profile', once = True)
+            def sampling_profiler(duration : str = '30', path : str = 'profile.collapsed'):
+                if duration == 'stop':
+                    self.profiler.stop()
+                    return
+                try:
+                    self.profiler.start(float(duration), path)
+                except RuntimeError as e:
+                    print(e)
+                    return
+                print(f'Profiling for {float(duration):.0f}s, writing collapsed stacks to {path}')
+        
+        return console
+        
     @property
     def music(self) -> Music:
         return self._music
         
+    @property
+    def mixers(self) -> Mixers:
+        return self._mixers
+        
+    @property
+    def clips(self) -> Clips:
+        return self._clips
+        
     @property
     def database(self) -> Database:
         return self._database
@@ -154,34 +377,86 @@ class Client(discord.Client):
     
     def retrieve_server(self, server_id : int) -> Server:
         if server_id == 0 or server_id == None: raise ValueError("Please provide a valid server id")
-        for server in self.servers:
-            if server.id == server_id: return server
+        server = self._servers_by_id.get(server_id)
+        if server is not None: return server
             
-        server = Server(self, server_id)
+        server = self._servers_by_id[server_id] = Server(self, server_id)
         self.servers.append(server)
         return server
     
     def retrieve_user(self, user_id : int):
         if user_id == 0 or user_id == None: raise ValueError("Please provide a valid user id")
-        for user in self.users:
-            if user.id == user_id: return user
+        user = self._users_by_id.get(user_id)
+        if user is not None: return user
             
         return self.new_user(user_id)
     
     def new_user(self, user_id : int, permission : Auth = Auth.DEFAULT):
         if user_id == 0 or user_id == None: raise ValueError("Please provide a valid user id")
-        for user in self.users:
-            if user.id == user_id: raise RuntimeError(f"The user with id '{user_id}' already exists!")
+        if user_id in self._users_by_id: raise RuntimeError(f"The user with id '{user_id}' already exists!")
             
-        user = User(user_id, permission = permission)
+        user = self._users_by_id[user_id] = User(user_id, permission = permission)
         self.users.append(user)
         return user
         
+    def _library_loaded(self) -> None:
+        print(f'Loaded {len(self.music.tracks)} tracks')
+        # Reported by whichever of the library and the login finishes last
+        if self._timeline.finish('library') and self._timeline.finished('login'): print(self._timeline.report())
+        
+    def _reload_permissions(self, old : Snapshot, new : Snapshot) -> None:
+        if old.permission == new.permission: return
+        
+        granted = {}
+        for permission, user_ids in new.permission.items():
+            for user_id in user_ids:
+                if user_id in granted:
+                    print(f"Ignored permission changes, you can't have multiple permissions assigned to one user in your {self.config.path}")
+                    return
+                granted[user_id] = Auth.convert(permission)
+        revoked = [user_id for user_ids in old.permission.values() for user_id in user_ids if user_id not in granted]
+        
+        def apply():
+            for user_id in revoked:
+                self.retrieve_user(user_id).permission = Auth.DEFAULT
+            for user_id, permission in granted.items():
+                self.retrieve_user(user_id).permission = permission
+            self.roles.invalidate()
+        
+        # Called from the watcher thread, the registries belong to the event loop
+        self.loop.call_soon_threadsafe(apply)
+        
+    def stats(self) -> dict:
+        return dict(
+            shards = list(self.shards.keys()) if isinstance(self, discord.AutoShardedClient) else [self.shard_id or 0],
+            guilds = len(self.guilds),
+            servers = len(self.servers),
+            users = len(self.users),
+            latency = self.latency,
+            shed = self.shedder.shed,
+            queued = self.events.scheduler.depth if self.events.scheduler is not None else 0,
+            ready = self.is_ready
+        )
+        
+    async def close(self) -> None:
+        # Writes changes still waiting for their debounce, they would be lost with the process otherwise
+        if self._config is not None: self._config.flush()
+        self.executors.shutdown()
+        self.cooldowns.stop()
+        await super().close()
+        
     def _run(self):
         if self.running: raise RuntimeError('You cannot run a running application!')
         if self.token is None: raise KeyError('There was no token provided in configuration')
         
-        self._database = Database()
+        # The library is read in the background, it overlaps with the database and the gateway login
+        if self._music_path is not None:
+            self._timeline.start('library')
+            self.music.load(self._music_path, finished = self._library_loaded)
+        
+        if self._database is None:
+            with self._timeline.phase('database'):
+                self._database = Database()
         
         for permission, user_ids in self.config.permission.items():
             for user_id in user_ids:
@@ -190,8 +465,12 @@ class Client(discord.Client):
                 except RuntimeError:
                     raise ValueError(f"You can't have multiple permissions assigned to one user in your {self.config.path}")
         
+        self.config.subscribe(self._reload_permissions)
+        self.config.watch()
+        
         self._running = True
         
+        self._timeline.start('login')
         super().run(self.token)
         
     def run(self, threaded : bool = False, access_console : Console = None) -> "Client":
@@ -205,6 +484,7 @@ class Client(discord.Client):
             self._run()
             
         if access_console:
+            self.register_console(access_console)
             if not self.is_ready: print("Please wait while bot is starting...")
             while not self.is_ready: pass
             while True:
@@ -212,8 +492,21 @@ class Client(discord.Client):
                     user_input = input('>>> ')
                     access_console.process(self, user_input)
                 except KeyboardInterrupt:
+                    if self._config is not None: self._config.flush()
                     raise KeyboardInterrupt('The program was interrupted by user.')
         
         return self
+
+
+class ShardedClient(Client, discord.AutoShardedClient):
+    """
+    Extends the client to run a range of shards in one process (``shard_ids`` and ``shard_count``)
+    """
     
-        
\ No newline at end of file
+    def __init__(self, *args, worker : int = 0, **options):
+        super().__init__(*args, **options)
+        self._worker : int = worker
+        
+    @property
+    def worker(self) -> int:
+        return self._worker
@@ -0,0 +1,105 @@
+import mmap, os, subprocess, threading
+
+import discord
+
+FRAME_SIZE : int = discord.opus.Encoder.FRAME_SIZE
+EXTENSION : str = 'pcm'
+
+
+class ClipSource(discord.AudioSource):
+    """
+    Plays a clip straight from its memory map, every server playing it reads the same pages
+    """
+
+    def __init__(self, data : mmap.mmap):
+        self._data : mmap.mmap = data
+        self._position : int = 0
+
+    def read(self) -> bytes:
+        start = self._position
+        if start >= len(self._data): return b''
+        self._position = start + FRAME_SIZE
+        frame = self._data[start:self._position]
+        # The encoder needs whole frames, the last one is padded with silence
+        return frame if len(frame) == FRAME_SIZE else frame + bytes(FRAME_SIZE - len(frame))
+
+
+class Clips:
+    """
+    Short sounds decoded once into raw 48kHz stereo pcm files, mapped into memory on first use
+    """
+
+    def __init__(self, directory : str = '.clips'):
+        self.directory : str = directory
+        self._maps : dict[str, mmap.mmap] = {}
+        self._lock : threading.Lock = threading.Lock()
+
+    @staticmethod
+    def valid(name : str) -> bool:
+        """
+        Whether ``name`` can name a clip, it must not reach outside of the clip directory
+        """
+        return bool(name) and os.path.basename(name) == name
+
+    def path(self, name : str) -> str:
+        if not self.valid(name): raise ValueError(f"'{name}' is no valid clip name")
+        return os.path.join(self.directory, f'{name}.{EXTENSION}')
+
+    @property
+    def names(self) -> list[str]:
+        if not os.path.isdir(self.directory): return []
+        return sorted(os.path.splitext(file)[0] for file in os.listdir(self.directory) if file.endswith(f'.{EXTENSION}'))
+
+    def __contains__(self, name : str) -> bool:
+        return self.valid(name) and (name in self._maps or os.path.exists(self.path(name)))
+
+    def add(self, name : str, source : str, executable : str = 'ffmpeg') -> str:
+        """
+        Decodes ``source`` with ffmpeg into the clip ``name``, blocks until it is done
+        """
+        if not self.valid(name): raise ValueError(f"'{name}' is no valid clip name")
+        # Mapped clips can't be replaced on windows, so clips are only ever added
+        if name in self: raise ValueError(f"There already is a clip named '{name}'")
+        os.makedirs(self.directory, exist_ok = True)
+
+        temporary = f'{self.path(name)}.tmp'
+        process = subprocess.run([executable, '-v', 'error', '-y', '-i', source, '-f', 's16le', '-ac', '2', '-ar', '48000', temporary], stdin = subprocess.DEVNULL)
+        if process.returncode != 0 or not os.path.exists(temporary) or os.path.getsize(temporary) == 0:
+            if os.path.exists(temporary): os.remove(temporary)
+            raise RuntimeError(f"ffmpeg couldn't decode '{source}'")
+        os.replace(temporary, self.path(name))
+        return self.path(name)
+
+    def _map(self, name : str) -> mmap.mmap:
+        data = self._maps.get(name)
+        if data is not None: return data
+
+        with self._lock:
+            if name not in self._maps:
+                with open(self.path(name), 'rb') as file:
+                    # The mapping stays valid after the file is closed
+                    self._maps[name] = mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ)
+            return self._maps[name]
+
+    def source(self, name : str) -> ClipSource:
+        """
+        A new source playing the clip ``name`` from the start, no subprocess is involved
+        """
+        try:
+            return ClipSource(self._map(name))
+        except (FileNotFoundError, ValueError):
+            raise KeyError(f"There is no clip named '{name}'") from None
+
+    @property
+    def count(self) -> int:
+        """
+        Number of clips mapped into memory so far
+        """
+        return len(self._maps)
+
+    @property
+    def mapped(self) -> int:
+        """
+        Bytes of all mapped clips, resident once in the page cache however often they play
+        """
+        return sum(len(data) for data in list(self._maps.values()))
@@ -0,0 +1,249 @@
+import asyncio, itertools, multiprocessing, threading, time
+
+from multiprocessing.connection import Connection
+from typing import TYPE_CHECKING, Callable
+
+if TYPE_CHECKING:
+    from core.client import Client
+    from core.console import Console
+
+
+def shard_ranges(shard_count : int, workers : int) -> list[list[int]]:
+    if workers < 1: raise ValueError('A cluster needs at least one worker')
+    if shard_count < workers: raise ValueError(f'Cannot split {shard_count} shards across {workers} workers')
+
+    size, remainder = divmod(shard_count, workers)
+    ranges = []
+    start = 0
+    for index in range(workers):
+        end = start + size + (1 if index < remainder else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+def _listen(client : "Client", console : "Console", connection : Connection) -> None:
+    while True:
+        try:
+            kind, payload = connection.recv()
+        except (EOFError, OSError):
+            # Supervisor is gone, shut the worker down
+            asyncio.run_coroutine_threadsafe(client.close(), client.loop)
+            return
+
+        match kind:
+            case 'command':
+                # Every worker shares the working directory, commands writing files only run in the first one
+                if client.worker != 0 and console.runs_once(payload): continue
+                console.process(client, payload)
+            case 'stats':
+                # Tagged with the request id, so a late reply is never taken for the answer of a later request
+                connection.send(('stats', (payload, client.stats())))
+            case 'stop':
+                asyncio.run_coroutine_threadsafe(client.close(), client.loop)
+                return
+
+
+def _work(factory : Callable[..., tuple["Client", "Console"]], index : int, shard_ids : list[int], shard_count : int, connection : Connection) -> None:
+    from core.client import ShardedClient
+
+    client, console = factory(cls = ShardedClient, shard_ids = shard_ids, shard_count = shard_count, worker = index)
+
+    listener = threading.Thread(target = _listen, args = (client, console, connection))
+    listener.daemon = True
+    listener.start()
+
+    try:
+        client.run()
+    finally:
+        client.config.flush()
+
+
+class Worker:
+    """
+    Handle of a worker process running a contiguous range of shards
+    """
+
+    def __init__(self, index : int, shard_ids : list[int]):
+        self._index : int = index
+        self._shard_ids : list[int] = shard_ids
+        self._process : multiprocessing.Process = None
+        self._connection : Connection = None
+        self._lock : threading.Lock = threading.Lock()
+        self._requests : itertools.count = itertools.count()
+        self._started : float = None
+        self.restarts : int = 0
+        # Crashes since the worker last ran stably, the restart delay grows with them
+        self.failures : int = 0
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def shard_ids(self) -> list[int]:
+        return self._shard_ids
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def uptime(self) -> float:
+        return time.monotonic() - self._started if self.alive else 0.0
+
+    @property
+    def exitcode(self) -> int:
+        return self._process.exitcode if self._process is not None else None
+
+    def start(self, context, factory : Callable, shard_count : int) -> None:
+        with self._lock:
+            parent, child = context.Pipe()
+            self._process = context.Process(
+                target = _work,
+                args = (factory, self.index, self.shard_ids, shard_count, child),
+                name = f'worker-{self.index}'
+            )
+            self._process.start()
+            self._started = time.monotonic()
+            child.close()
+            self._connection = parent
+
+    def send(self, kind : str, payload = None) -> bool:
+        with self._lock:
+            if not self.alive: return False
+            try:
+                self._connection.send((kind, payload))
+            except (BrokenPipeError, OSError):
+                return False
+            return True
+
+    def request(self, kind : str, timeout : float = 5.0):
+        with self._lock:
+            if not self.alive: return None
+            request_id = next(self._requests)
+            deadline = time.monotonic() + timeout
+            try:
+                self._connection.send((kind, request_id))
+                while True:
+                    if not self._connection.poll(max(0.0, deadline - time.monotonic())): return None
+                    _, (reply_id, payload) = self._connection.recv()
+                    # Replies to requests which already timed out are skipped
+                    if reply_id == request_id: return payload
+            except (EOFError, BrokenPipeError, OSError):
+                return None
+
+    def join(self, timeout : float = None) -> None:
+        if self._process is not None: self._process.join(timeout)
+
+    def terminate(self) -> None:
+        if self.alive: self._process.terminate()
+
+
+class Cluster:
+    """
+    Supervises worker processes which each run a ``core.client.ShardedClient`` over a contiguous shard range
+    """
+
+    def __init__(self, factory : Callable[..., tuple["Client", "Console"]], workers : int = None, shard_count : int = None, restart_delay : float = 5.0, max_restart_delay : float = 300.0, stable_after : float = 600.0):
+        workers = workers or multiprocessing.cpu_count()
+
+        self._factory : Callable = factory
+        self._shard_count : int = shard_count or workers
+        self._workers : list[Worker] = [Worker(index, shard_ids) for index, shard_ids in enumerate(shard_ranges(self._shard_count, workers))]
+        self._context = multiprocessing.get_context('spawn')
+        self._restart_delay : float = restart_delay
+        self._max_restart_delay : float = max_restart_delay
+        self._stable_after : float = stable_after
+        self._running : bool = False
+        self._supervisor : threading.Thread = None
+
+    @property
+    def workers(self) -> list[Worker]:
+        return self._workers
+
+    @property
+    def shard_count(self) -> int:
+        return self._shard_count
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self) -> "Cluster":
+        if self.running: raise RuntimeError('You cannot start a running cluster!')
+
+        self._running = True
+        for worker in self.workers:
+            worker.start(self._context, self._factory, self.shard_count)
+            print(f'Started worker {worker.index} with shards {worker.shard_ids[0]}-{worker.shard_ids[-1]}')
+
+        self._supervisor = threading.Thread(target = self._supervise)
+        self._supervisor.daemon = True
+        self._supervisor.start()
+        return self
+
+    def _supervise(self) -> None:
+        next_restart : dict[int, float] = {}
+        while self.running:
+            for worker in self.workers:
+                if worker.alive and worker.failures and worker.uptime > self._stable_after:
+                    # Ran long enough after its last crash, the next crash starts with the shortest delay again
+                    worker.failures = 0
+                if worker.alive or not self.running: continue
+
+                # Back off exponentially when a worker keeps crashing
+                delay = min(self._restart_delay * 2 ** worker.failures, self._max_restart_delay)
+                if worker.index not in next_restart:
+                    print(f'Worker {worker.index} exited with code {worker.exitcode}, restarting in {delay:.0f}s')
+                    next_restart[worker.index] = time.monotonic() + delay
+                if time.monotonic() < next_restart[worker.index]: continue
+
+                del next_restart[worker.index]
+                worker.restarts += 1
+                worker.failures += 1
+                worker.start(self._context, self._factory, self.shard_count)
+            time.sleep(1)
+
+    def broadcast(self, user_input : str) -> int:
+        return sum(worker.send('command', user_input) for worker in self.workers)
+
+    def stats(self) -> dict:
+        stats = dict(workers = len(self.workers), alive = 0, restarts = 0, shards = self.shard_count, guilds = 0, servers = 0, users = 0, latency = 0.0)
+        latencies = []
+        for worker in self.workers:
+            stats['restarts'] += worker.restarts
+            worker_stats = worker.request('stats')
+            if worker_stats is None: continue
+
+            stats['alive'] += 1
+            for key in ('guilds', 'servers', 'users'):
+                stats[key] += worker_stats[key]
+            latencies.append(worker_stats['latency'])
+
+        stats['latency'] = sum(latencies) / len(latencies) if latencies else float('nan')
+        return stats
+
+    def stop(self, timeout : float = 10.0) -> None:
+        self._running = False
+        for worker in self.workers:
+            worker.send('stop')
+        for worker in self.workers:
+            worker.join(timeout)
+            worker.terminate()
+
+    def run(self) -> None:
+        self.start()
+        try:
+            while True:
+                user_input = input('>>> ')
+                if user_input == "": continue
+                if user_input == 'stats':
+                    for key, value in self.stats().items():
+                        print(f'{key}: {value}')
+                    continue
+                print(f'Sent to {self.broadcast(user_input)}/{len(self.workers)} workers')
+        except (KeyboardInterrupt, EOFError):
+            print('Stopping cluster...')
+        finally:
+            self.stop()
@@ -1,6 +1,40 @@
-import yaml
+import dataclasses, os, threading, time, types, yaml
+
+from typing import Any, Callable
+
+
+@dataclasses.dataclass(frozen = True)
+class Snapshot:
+    """
+    Immutable state of the configuration, replaced as a whole on every change
+    """
+    
+    token : str
+    prefix : str
+    permission : types.MappingProxyType
+    speech : types.MappingProxyType
+    outbox : types.MappingProxyType
+    metrics : types.MappingProxyType
+    shedding : types.MappingProxyType
+    scheduler : types.MappingProxyType
+    executor : types.MappingProxyType
+    memory : types.MappingProxyType
+    
+    @staticmethod
+    def construct(raw_configuration : dict) -> "Snapshot":
+        return Snapshot(
+            token = raw_configuration['discord']['token'],
+            prefix = str(raw_configuration['discord']['prefix']),
+            permission = types.MappingProxyType({auth: tuple(user_ids or ()) for auth, user_ids in raw_configuration['discord']['permission'].items()}),
+            speech = types.MappingProxyType(raw_configuration.get('speech') or {}),
+            outbox = types.MappingProxyType(raw_configuration.get('outbox') or {}),
+            metrics = types.MappingProxyType(raw_configuration.get('metrics') or {}),
+            shedding = types.MappingProxyType(raw_configuration.get('shedding') or {}),
+            scheduler = types.MappingProxyType(raw_configuration.get('scheduler') or {}),
+            executor = types.MappingProxyType(raw_configuration.get('executor') or {}),
+            memory = types.MappingProxyType(raw_configuration.get('memory') or {})
+        )
 
-from typing import Any
 
 class Configuration:
     """
@@ -18,6 +52,42 @@ class Configuration:
                     owner = ['owner id 1', 'owner id 2', 'owner id 3']
                 ),
                 prefix = '.'
+            ),
+            speech = dict(
+                credentials = None,
+                lang = 'de-DE',
+                model = 'phone_call'
+            ),
+            outbox = dict(
+                max_in_flight = 10,
+                rate = 5,
+                per = 5.0
+            ),
+            metrics = dict(
+                path = None,
+                port = None,
+                interval = 15
+            ),
+            shedding = dict(
+                max_lag = 0.5,
+                max_queue = 1000
+            ),
+            scheduler = dict(
+                enabled = False,
+                workers = 8,
+                max_queue = 100,
+                overflow = 'drop_oldest'
+            ),
+            executor = dict(
+                threads = None,
+                processes = None,
+                timeout = None
+            ),
+            memory = dict(
+                max_messages = 1000,
+                intents = 'default',
+                member_cache = 'from_intents',
+                chunk_guilds_at_startup = None
             )
         )
 
@@ -32,16 +102,22 @@ class Configuration:
         return yml
     
     def update_yml(self, reference : str, value : Any) -> None:
+        self.update_yml_values({reference: value})
+    
+    def update_yml_values(self, values : dict[str, Any]) -> None:
         with open(self.path, 'r') as stream:
             yml = yaml.safe_load(stream)
             
-        yml['discord'][reference] = value
-            
-        with open(self.path, 'w') as outfile:
+        yml['discord'].update(values)
+        
+        # Replace the file at once, so the watcher never reads a half written configuration
+        with open(f'{self.path}.tmp', 'w') as outfile:
             yaml.dump(yml, outfile, default_flow_style = False)
+        os.replace(f'{self.path}.tmp', self.path)
+        self._modified = self._stat()
             
     
-    def __init__(self, path : str = 'config.yml'):
+    def __init__(self, path : str = 'config.yml', debounce : float = 1.0):
         try:
             raw_configuration = self.__class__.load_yml(path)
         except FileNotFoundError:
@@ -49,9 +125,85 @@ class Configuration:
             raise FileNotFoundError(f"There is no such configuration file '{path}'. Generated template instead, please fill it out and retry.")
         
         self._path : str = path
-        self._token : str = raw_configuration['discord']['token']
-        self._permission : int = raw_configuration['discord']['permission']
-        self._prefix : str = raw_configuration['discord']['prefix']
+        self._snapshot : Snapshot = Snapshot.construct(raw_configuration)
+        self._debounce : float = debounce
+        self._pending : dict[str, Any] = {}
+        self._timer : threading.Timer = None
+        self._lock : threading.Lock = threading.Lock()
+        self._modified : tuple[int, int] = self._stat()
+        self._watcher : threading.Thread = None
+        self._subscribers : list[Callable[[Snapshot, Snapshot], None]] = []
+    
+    def _stat(self) -> tuple[int, int]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    @property
+    def snapshot(self) -> Snapshot:
+        return self._snapshot
+    
+    def _persist(self, **values) -> None:
+        """
+        Writes ``values`` into the discord section after ``debounce`` seconds without further changes
+        """
+        with self._lock:
+            self._pending.update(values)
+            if self._timer is not None: self._timer.cancel()
+            self._timer = threading.Timer(self._debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def flush(self) -> None:
+        with self._lock:
+            if self._timer is not None: self._timer.cancel()
+            self._timer = None
+            values, self._pending = self._pending, {}
+            if values: self.update_yml_values(values)
+    
+    def subscribe(self, callback : Callable[[Snapshot, Snapshot], None]) -> None:
+        """
+        ``callback(old, new)`` is called from the watcher thread after the configuration file changed
+        """
+        self._subscribers.append(callback)
+    
+    def reload(self) -> Snapshot:
+        """
+        Applies the settings that do not depend on the token from the configuration file
+        """
+        raw_configuration = self.__class__.load_yml(self.path)
+        old = self._snapshot
+        loaded = Snapshot.construct(raw_configuration)
+        new = dataclasses.replace(old, prefix = loaded.prefix, permission = loaded.permission)
+        if new == old: return old
+        
+        self._snapshot = new
+        for callback in self._subscribers:
+            callback(old, new)
+        return new
+    
+    def watch(self, interval : float = 2.0) -> threading.Thread:
+        if self._watcher is not None: return self._watcher
+        
+        def loop():
+            while True:
+                time.sleep(interval)
+                modified = self._stat()
+                if modified is None or modified == self._modified: continue
+                self._modified = modified
+                try:
+                    snapshot = self.reload()
+                except Exception as e:
+                    print(f"Couldn't reload '{self.path}': {e}")
+                    continue
+                print(f"Reloaded '{self.path}', prefix is '{snapshot.prefix}'")
+        
+        self._watcher = threading.Thread(target = loop, name = 'configuration-watcher')
+        self._watcher.daemon = True
+        self._watcher.start()
+        return self._watcher
     
     @property
     def path(self) -> str:
@@ -63,29 +215,56 @@ class Configuration:
     
     @property
     def token(self) -> str:
-        return self._token
+        return self._snapshot.token
     
     @token.setter
     def token(self, token : str) -> None:
         if not isinstance(token, str): raise TypeError('Please use a ``str`` when overwritting the token.')
-        self._token = token
+        self._snapshot = dataclasses.replace(self._snapshot, token = token)
         
     @property
-    def permission(self) -> dict[str, list[int]]:
-        return self._permission
+    def permission(self) -> types.MappingProxyType:
+        return self._snapshot.permission
     
     @permission.setter
     def permission(self, *args) -> RuntimeError:
         raise RuntimeError('Please use exclusively the configuration file to edit list of global permissions!')
     
+    @property
+    def speech(self) -> types.MappingProxyType:
+        return self._snapshot.speech
+    
+    @property
+    def outbox(self) -> types.MappingProxyType:
+        return self._snapshot.outbox
+    
+    @property
+    def metrics(self) -> types.MappingProxyType:
+        return self._snapshot.metrics
+    
+    @property
+    def shedding(self) -> types.MappingProxyType:
+        return self._snapshot.shedding
+    
+    @property
+    def scheduler(self) -> types.MappingProxyType:
+        return self._snapshot.scheduler
+    
+    @property
+    def executor(self) -> types.MappingProxyType:
+        return self._snapshot.executor
+    
+    @property
+    def memory(self) -> types.MappingProxyType:
+        return self._snapshot.memory
+    
     @property
     def prefix(self) -> str:
-        return self._prefix
+        return self._snapshot.prefix
     
     @prefix.setter
     def prefix(self, prefix : str) -> None:
         if not isinstance(prefix, str): prefix = str(prefix)
         
-        self.update_yml('prefix', prefix)
-        
-        self._prefix = prefix
\ No newline at end of file
+        self._snapshot = dataclasses.replace(self._snapshot, prefix = prefix)
+        self._persist(prefix = prefix)
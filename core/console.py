@@ -1,6 +1,8 @@
-import asyncio
+import asyncio, concurrent.futures, traceback
 from typing import TYPE_CHECKING, Awaitable, Callable
 
+from core.enums import Offload
+
 if TYPE_CHECKING:
     from core.client import Client
 
@@ -10,6 +12,8 @@ class Console:
     def __init__(self):
         self.client = None
         self.functions = {}
+        self.offloaded = {}
+        self.once = set()
     
     def process(self, client : "Client", user_input : str) -> None:
         if user_input == "": return
@@ -28,16 +32,50 @@ class Console:
         args = tuple(args)
 
         try:
-            if asyncio.iscoroutinefunction(self.functions[command]):
-                client.loop.create_task(self.functions[command](*args))
+            if command in self.offloaded:
+                offload, timeout = self.offloaded[command]
+                future = asyncio.run_coroutine_threadsafe(client.executors.run(self.functions[command], *args, offload = offload, timeout = timeout), client.loop)
+                future.add_done_callback(lambda future: self._report(command, future))
+            elif asyncio.iscoroutinefunction(self.functions[command]):
+                future = asyncio.run_coroutine_threadsafe(self.functions[command](*args), client.loop)
+                future.add_done_callback(lambda future: self._report(command, future))
             else:
                 self.functions[command](*args)
-        except TypeError as e:
-            print(e)
+        except Exception as e:
+            # A failing command must not end the input loop of the console
+            print(f"The '{command}' command failed: {e}")
+    
+    def runs_once(self, user_input : str) -> bool:
+        """
+        Whether the command of ``user_input`` writes shared files, a cluster runs it in its first worker only
+        """
+        return user_input.split(" ")[0] in self.once
+    
+    @staticmethod
+    def _report(command : str, future : concurrent.futures.Future) -> None:
+        if future.cancelled(): return
+        if future.exception() is not None:
+            print(f"The '{command}' command failed:")
+            traceback.print_exception(future.exception())
+        elif future.result() is not None:
+            print(future.result())
     
-    def func(self, command : str):
+    def func(self, command : str, offload : Offload = None, timeout : float = None, once : bool = False):
+        """
+        With ``offload`` a plain function runs in the thread or process pool of the client, its result is printed when done
+        With ``once`` the command runs in a single worker of a cluster, for commands writing files every worker would write at the same time
+        """
         def decorator(callback : Awaitable[None] | Callable):
+            if offload is not None and asyncio.iscoroutinefunction(callback): raise TypeError('Only plain functions can be offloaded, coroutine functions run on the event loop')
             self.functions[command] = callback
+            if offload is not None:
+                self.offloaded[command] = (Offload.convert(offload), timeout)
+            else:
+                self.offloaded.pop(command, None)
+            if once:
+                self.once.add(command)
+            else:
+                self.once.discard(command)
             
             return callback
 
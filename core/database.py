@@ -8,15 +8,30 @@ from core.enums import Auth
 
 class Database:
     
-    def __init__(self):
-        self._connection : sqlite3.Connection = sqlite3.connect('.sqlite')
+    def __init__(self, path : str = '.sqlite', timeout : float = 30.0):
+        # Several cluster workers may share the same file, WAL lets readers and a writer work concurrently
+        self._connection : sqlite3.Connection = sqlite3.connect(path, timeout = timeout)
         self._cursor : sqlite3.Cursor = self.connection.cursor()
         
+        self.cursor.execute('PRAGMA journal_mode = WAL')
+        self.cursor.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+        
         self.cursor.execute('''
                             CREATE TABLE IF NOT EXISTS members
                             ([user_id] INTEGER NOT NULL, [server_id] INTEGER NOT NULL, [permission] INTEGER NOT NULL, PRIMARY KEY (user_id, server_id))
                             ''')
         
+        # channel_id 0 holds the prefix of the whole server
+        self.cursor.execute('''
+                            CREATE TABLE IF NOT EXISTS prefixes
+                            ([server_id] INTEGER NOT NULL, [channel_id] INTEGER NOT NULL, [prefix] TEXT NOT NULL, PRIMARY KEY (server_id, channel_id))
+                            ''')
+        
+        self.cursor.execute('''
+                            CREATE TABLE IF NOT EXISTS roles
+                            ([server_id] INTEGER NOT NULL, [role_id] INTEGER NOT NULL, [permission] INTEGER NOT NULL, PRIMARY KEY (server_id, role_id))
+                            ''')
+        
         self.connection.commit()
 
     @property
@@ -29,7 +44,7 @@ class Database:
         
     def insert_member(self, member : "Member"):
         self.cursor.execute(f'''
-                            INSERT INTO members (user_id, server_id, permission)
+                            INSERT OR IGNORE INTO members (user_id, server_id, permission)
 
                                     VALUES
                                     ({member.user.id},{member.server.id},{member._permission.value})
@@ -83,4 +98,54 @@ class Database:
             )
             database_entries.append(database_entry)
         
-        return database_entries
\ No newline at end of file
+        return database_entries
+    
+    def read_prefixes(self, server_id : int) -> dict[int, str]:
+        self.cursor.execute('''
+                            SELECT channel_id, prefix FROM prefixes
+                            WHERE server_id = ?
+                            ''', (server_id,))
+        
+        return {row[0]: row[1] for row in self.cursor.fetchall()}
+    
+    def update_prefix(self, server_id : int, channel_id : int, prefix : str):
+        self.cursor.execute('''
+                            INSERT OR REPLACE INTO prefixes (server_id, channel_id, prefix)
+                            VALUES (?, ?, ?)
+                            ''', (server_id, channel_id, prefix))
+        
+        self.connection.commit()
+    
+    def delete_prefix(self, server_id : int, channel_id : int):
+        self.cursor.execute('''
+                            DELETE FROM prefixes
+                            WHERE server_id = ?
+                            AND channel_id = ?
+                            ''', (server_id, channel_id))
+        
+        self.connection.commit()
+    
+    def read_roles(self, server_id : int) -> dict[int, Auth]:
+        self.cursor.execute('''
+                            SELECT role_id, permission FROM roles
+                            WHERE server_id = ?
+                            ''', (server_id,))
+        
+        return {row[0]: Auth.convert(row[1]) for row in self.cursor.fetchall()}
+    
+    def update_role(self, server_id : int, role_id : int, permission : Auth):
+        self.cursor.execute('''
+                            INSERT OR REPLACE INTO roles (server_id, role_id, permission)
+                            VALUES (?, ?, ?)
+                            ''', (server_id, role_id, permission.value))
+        
+        self.connection.commit()
+    
+    def delete_role(self, server_id : int, role_id : int):
+        self.cursor.execute('''
+                            DELETE FROM roles
+                            WHERE server_id = ?
+                            AND role_id = ?
+                            ''', (server_id, role_id))
+        
+        self.connection.commit()
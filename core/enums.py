@@ -4,7 +4,7 @@ class Event(Enum):
     ON_MESSAGE = auto()
     ON_COMMAND = auto()
     ON_REACTION_ADD = auto()
-    ON_REACTION_REMOVE = auto() # Not implemented yet
+    ON_REACTION_REMOVE = auto()
     ON_MEMBER_JOIN = auto()
     ON_MEMBER_REMOVE = auto()
     
@@ -71,4 +71,85 @@ class Auth(Enum):
             case Auth.OWNER.value | Auth.OWNER.name:
                 return Auth.OWNER
             case _:
-                raise ValueError(f"The auth level {auth} is unknown. Please check ``core.enums.Auth`` for further informations")
\ No newline at end of file
+                raise ValueError(f"The auth level {auth} is unknown. Please check ``core.enums.Auth`` for further informations")
+            
+
+class Bucket(Enum):
+    USER = 0
+    CHANNEL = 1
+    GUILD = 2
+    GLOBAL = 3
+    
+    @staticmethod
+    def convert(bucket : int | str) -> "Bucket":
+        if isinstance(bucket, Bucket): return bucket
+        if not isinstance(bucket, int) and not isinstance(bucket, str): raise TypeError('Please use a ``int`` or ``str`` for bucket conversion.')
+        
+        try:
+            bucket = int(bucket)
+        except ValueError:
+            bucket = bucket
+        bucket = bucket.upper() if isinstance(bucket, str) else bucket
+        
+        match bucket:
+            case Bucket.USER.value | Bucket.USER.name:
+                return Bucket.USER
+            case Bucket.CHANNEL.value | Bucket.CHANNEL.name:
+                return Bucket.CHANNEL
+            case Bucket.GUILD.value | Bucket.GUILD.name:
+                return Bucket.GUILD
+            case Bucket.GLOBAL.value | Bucket.GLOBAL.name:
+                return Bucket.GLOBAL
+            case _:
+                raise ValueError(f"The bucket {bucket} is unknown. Please check ``core.enums.Bucket`` for further informations")
+            
+
+class Overflow(Enum):
+    DROP_NEWEST = 0
+    DROP_OLDEST = 1
+    WAIT = 2
+    
+    @staticmethod
+    def convert(overflow : int | str) -> "Overflow":
+        if isinstance(overflow, Overflow): return overflow
+        if not isinstance(overflow, int) and not isinstance(overflow, str): raise TypeError('Please use a ``int`` or ``str`` for overflow policy conversion.')
+        
+        try:
+            overflow = int(overflow)
+        except ValueError:
+            overflow = overflow
+        overflow = overflow.upper() if isinstance(overflow, str) else overflow
+        
+        match overflow:
+            case Overflow.DROP_NEWEST.value | Overflow.DROP_NEWEST.name:
+                return Overflow.DROP_NEWEST
+            case Overflow.DROP_OLDEST.value | Overflow.DROP_OLDEST.name:
+                return Overflow.DROP_OLDEST
+            case Overflow.WAIT.value | Overflow.WAIT.name:
+                return Overflow.WAIT
+            case _:
+                raise ValueError(f"The overflow policy {overflow} is unknown. Please check ``core.enums.Overflow`` for further informations")
+            
+
+class Offload(Enum):
+    THREAD = 0
+    PROCESS = 1
+    
+    @staticmethod
+    def convert(offload : int | str) -> "Offload":
+        if isinstance(offload, Offload): return offload
+        if not isinstance(offload, int) and not isinstance(offload, str): raise TypeError('Please use a ``int`` or ``str`` for offload conversion.')
+        
+        try:
+            offload = int(offload)
+        except ValueError:
+            offload = offload
+        offload = offload.upper() if isinstance(offload, str) else offload
+        
+        match offload:
+            case Offload.THREAD.value | Offload.THREAD.name:
+                return Offload.THREAD
+            case Offload.PROCESS.value | Offload.PROCESS.name:
+                return Offload.PROCESS
+            case _:
+                raise ValueError(f"The offload {offload} is unknown. Please check ``core.enums.Offload`` for further informations")
@@ -1,17 +1,78 @@
-import asyncio, discord
+import asyncio, collections, discord, itertools, time
 
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Awaitable, Union
-from core.enums import Auth, Restriction, Event
+from typing import TYPE_CHECKING, Awaitable, Callable, Union
+from core.enums import Auth, Restriction, Event, Offload, Overflow
+from core.metrics import Histogram, Stat
+from core.ratelimit import Cooldown
 
 if TYPE_CHECKING:
     from core.client import Client
 
 
+def _id(value) -> int:
+    return getattr(value, 'id', value)
+
+
+class Scope:
+    """
+    Restricts a handler to a server, a channel, authors or roles
+    """
+    
+    def __init__(self, guild : int = None, channel : int = None, author : int | list[int] = None, role : int | list[int] = None):
+        self.guild : int = _id(guild)
+        self.channel : int = _id(channel)
+        self.authors : frozenset[int] = frozenset(_id(value) for value in (author if isinstance(author, (list, tuple, set, frozenset)) else [author]) if value is not None)
+        self.roles : frozenset[int] = frozenset(_id(value) for value in (role if isinstance(role, (list, tuple, set, frozenset)) else [role]) if value is not None)
+        
+    @property
+    def key(self) -> tuple[str, int]:
+        # Channel ids are unique across servers, so a channel scope needs no server lookup
+        if self.channel is not None: return ('channel', self.channel)
+        if self.guild is not None: return ('guild', self.guild)
+        return None
+    
+    @property
+    def filtered(self) -> bool:
+        return bool(self.authors or self.roles)
+    
+    def matches(self, author : Union[discord.Member, discord.User]) -> bool:
+        if self.authors and (author is None or author.id not in self.authors): return False
+        if self.roles and not any(role.id in self.roles for role in getattr(author, 'roles', ())): return False
+        return True
+
+
 class Single(ABC):
+    
+    _order = itertools.count()
         
     def __init__(self, coro : Awaitable[None]):
         self._coroutine : Awaitable[None] = coro
+        self.stat : Stat = Stat()
+        self.scope : Scope = Scope()
+        self.order : int = next(Single._order)
+        self.key : str = None
+        
+    @staticmethod
+    def origin(*args) -> tuple[int, int, Union[discord.Member, discord.User]]:
+        """
+        Server id, channel id and author of the event arguments
+        """
+        return (None, None, None)
+    
+    @staticmethod
+    def lookup(*args, **kwargs) -> str:
+        """
+        Key the handlers of the event arguments are indexed with
+        """
+        return None
+    
+    @classmethod
+    def lookups(cls, *args, **kwargs) -> tuple:
+        """
+        All keys handlers of the event arguments can be indexed with, most events have a single one
+        """
+        return (cls.lookup(*args, **kwargs),)
         
     @property
     def coroutine(self) -> Awaitable[None]:
@@ -20,7 +81,13 @@ class Single(ABC):
     @abstractmethod
     async def execute(self, *args, **kwargs) -> None:
         # do conditional stuff here
-        await self.coroutine(*args, **kwargs)
+        start = time.perf_counter()
+        failed = True
+        try:
+            await self.coroutine(*args, **kwargs)
+            failed = False
+        finally:
+            self.stat.record(time.perf_counter() - start, failed)
     
     
 class Member_Event(Single):
@@ -28,17 +95,38 @@ class Member_Event(Single):
     def __init__(self, coro : Awaitable[None]):
         super().__init__(coro)
         
+    @staticmethod
+    def origin(member : discord.Member, *args) -> tuple[int, int, discord.Member]:
+        return (member.guild.id, None, member)
+        
     async def execute(self, client : "Client", member : discord.Member) -> None:
         await super().execute(member)
 
 
 class Reaction_Event(Single):
+    """
+    Handles raw reaction events, optionally only those of one message and/or emoji
+    """
     
-    def __init__(self, coro : Awaitable[None]):
+    def __init__(self, coro : Awaitable[None], message : int = None, emoji : str = None):
         super().__init__(coro)
         
-    async def execute(self, client : "Client", reaction : discord.Reaction, user : Union[discord.Member, discord.User]) -> None:
-        await super().execute(reaction, user)
+        self.message : int = _id(message)
+        self.emoji : str = str(emoji) if emoji is not None else None
+        self.key : tuple[int, str] = (self.message, self.emoji)
+        
+    @staticmethod
+    def origin(payload : discord.RawReactionActionEvent, *args) -> tuple[int, int, discord.Member]:
+        return (payload.guild_id, payload.channel_id, payload.member)
+    
+    @staticmethod
+    def lookups(payload : discord.RawReactionActionEvent, *args) -> tuple[tuple[int, str]]:
+        # Handlers of any message and emoji, of the message, of the emoji and of both, each a single dict lookup
+        emoji = str(payload.emoji)
+        return ((None, None), (payload.message_id, None), (None, emoji), (payload.message_id, emoji))
+        
+    async def execute(self, client : "Client", payload : discord.RawReactionActionEvent) -> None:
+        await super().execute(payload)
 
 
 class Message_Event(Single):
@@ -49,6 +137,10 @@ class Message_Event(Single):
         self.restriction : Restriction = restriction
         self.after_command : bool = after_command
         
+    @staticmethod
+    def origin(message : discord.Message, *args) -> tuple[int, int, Union[discord.Member, discord.User]]:
+        return (message.guild.id if message.guild is not None else None, message.channel.id, message.author)
+        
     async def execute(self, client : "Client", message : discord.Message, after_command : bool) -> None:
         if not after_command == self.after_command: return
         
@@ -57,27 +149,53 @@ class Message_Event(Single):
 
 class Command_Event(Single):
     
-    def __init__(self, coro : Awaitable[None], command : str, permission : Auth = Auth.DEFAULT, restriction : Restriction = Restriction.NONE, requires_voice : bool = False):
+    def __init__(self, coro : Awaitable[None], command : str, permission : Auth = Auth.DEFAULT, restriction : Restriction = Restriction.NONE, requires_voice : bool = False, requires_library : bool = False, cooldown : Cooldown = None):
         super().__init__(coro)
 
         self.command : str = command
         self.permission : Auth = permission
         self.restriction : Restriction = restriction
         self.requires_voice : bool = requires_voice
+        self.requires_library : bool = requires_library
+        self.cooldown : Cooldown = cooldown
+        self.key : str = command
+        
+    @staticmethod
+    def origin(message : discord.Message, *args) -> tuple[int, int, Union[discord.Member, discord.User]]:
+        return (message.guild.id if message.guild is not None else None, message.channel.id, message.author)
+    
+    @staticmethod
+    def lookup(message : discord.Message, prefix : str) -> str:
+        return message.content[len(prefix):].split(' ', 1)[0]
         
     async def execute(self, client : "Client", message : discord.Message, prefix : str) -> None:
         if not message.content.startswith(f'{prefix}{self.command}'): return
         
-        await message.channel.trigger_typing()
-        if not client.retrieve_server(message.guild.id).retrieve_member(message.author.id).has_permission(self.permission):
-            await message.channel.send("You don't have the necessary permission to use this command.")
+        # Rejected before anything is sent or looked up, so rejecting stays cheap under load
+        if self.permission == Auth.DEFAULT and client.shedder.shedding:
+            client.shedder.shed += 1
+            return
+        if not client.roles.has_permission(message.author, self.permission):
+            client.outbox.send(message.channel, "You don't have the necessary permission to use this command.")
             return
         if self.restriction != Restriction.NONE and message.channel.is_nsfw():
-            await message.channel.send("You are not allowed to use this command outside of a NSFW channel.")
+            client.outbox.send(message.channel, "You are not allowed to use this command outside of a NSFW channel.")
             return
         if self.requires_voice and message.guild.voice_client is None:
-            await message.reply(f"I'm required to be connected to a voice channel for this action.")
+            client.outbox.reply(message, f"I'm required to be connected to a voice channel for this action.")
+            return
+        if self.requires_library and client.music.loading:
+            client.outbox.reply(message, "The music library is still loading, please try again in a moment.")
             return
+        # Only commands which would run take a token, rejected ones can't lock a command for everyone else
+        if self.cooldown is not None:
+            bucket = client.cooldowns.hit(self.cooldown, message)
+            if bucket is not None:
+                if not bucket.notified: client.outbox.reply(message, f"Slow down, you can use this command again in {bucket.delay():.1f}s.")
+                bucket.notified = True
+                return
+        
+        client.outbox.typing(message.channel)
         await super().execute(message, *tuple(message.content[len(prefix) + len(self.command) + 1:].split(" ")))
     
     
@@ -86,6 +204,10 @@ class Collection:
     def __init__(self, client : "Client"):
         self._client : "Client" = client
         self._events : list[Single] = []
+        # (scope key, lookup key) -> handlers, see ``Scope.key`` and ``Single.lookup``
+        self._index : dict[tuple, list[Single]] = {}
+        self._scoped : bool = False
+        self.stat : Stat = Stat()
         
     @property
     def client(self) -> "Client":
@@ -95,38 +217,50 @@ class Collection:
     def events(self) -> list[Single]:
         return self._events
     
+    def __len__(self) -> int:
+        return len(self._events)
+    
+    def handlers(self, *args, **kwargs) -> list[Single]:
+        """
+        Handlers registered for the server, channel and lookup key of the event arguments
+        """
+        if not self._events: return []
+        kind = type(self._events[0])
+        keys = kind.lookups(*args, **kwargs)
+        if len(keys) == 1:
+            handlers = self._index.get((None, keys[0]), [])
+        else:
+            handlers = [event for key in keys for event in self._index.get((None, key), ())]
+            if len(handlers) > 1: handlers.sort(key = lambda event: event.order)
+        if not self._scoped: return handlers
+        
+        guild_id, channel_id, author = kind.origin(*args)
+        scoped = [event for key in keys for scope in (('guild', guild_id), ('channel', channel_id)) for event in self._index.get((scope, key), ())]
+        if scoped: handlers = sorted(handlers + scoped, key = lambda event: event.order)
+        return [event for event in handlers if not event.scope.filtered or event.scope.matches(author)]
+    
     async def process(self, *args, **kwargs) -> "Collection":
-        for event in self.events:
+        for event in self.handlers(*args, **kwargs):
             await event.execute(self.client, *args, **kwargs)
             
         return self
     
-    def add(self, coro : Awaitable[None], event_type : Event, *args, **kwargs) -> "Collection":
+    def add(self, coro : Awaitable[None], event_type : Event, *args, guild : int = None, channel : int = None, author : int | list[int] = None, role : int | list[int] = None, **kwargs) -> "Collection":
         if not isinstance(event_type, Event): raise TypeError(f"{event_type.__type__} is unequal {Event}.")
         
         match event_type:
             case Event.ON_MESSAGE:
-                self.events.append(
-                    Message_Event(coro, *args, **kwargs)
-                )
+                event = Message_Event(coro, *args, **kwargs)
             case Event.ON_COMMAND:
-                self.events.append(
-                    Command_Event(coro, *args, **kwargs)
-                )
+                event = Command_Event(coro, *args, **kwargs)
             case Event.ON_REACTION_ADD:
-                self.events.append(
-                    Reaction_Event(coro, *args, **kwargs)
-                )
+                event = Reaction_Event(coro, *args, **kwargs)
             case Event.ON_REACTION_REMOVE:
-                raise NotImplementedError(f"The event '{event_type.name}' is not implemented yet")
+                event = Reaction_Event(coro, *args, **kwargs)
             case Event.ON_MEMBER_JOIN:
-                self.events.append(
-                    Member_Event(coro, *args, **kwargs)
-                )
+                event = Member_Event(coro, *args, **kwargs)
             case Event.ON_MEMBER_REMOVE:
-                self.events.append(
-                    Member_Event(coro, *args, **kwargs)
-                )
+                event = Member_Event(coro, *args, **kwargs)
             case Event.ON_MESSAGE_DELETE:
                 raise NotImplementedError(f"The event '{event_type.name}' is not implemented yet")
             case Event.ON_MESSAGE_EDIT:
@@ -147,13 +281,127 @@ class Collection:
                 raise NotImplementedError(f"The event '{event_type.name}' is not implemented yet")
             case _:
                 raise ValueError(f"The event {event_type} is unknown. Please check ``core.enums.Event`` for further informations")
+        
+        event.stat = self.client.metrics.handler(event_type, coro.__name__)
+        event.scope = Scope(guild, channel, author, role)
+        # Author and role filters are checked per event, so they are only indexed together with a server or channel
+        if event.scope.key is not None or event.scope.filtered: self._scoped = True
+        self._index.setdefault((event.scope.key, event.key), []).append(event)
+        self.events.append(event)
                 
         return self
 
 
+class Scheduler:
+    """
+    Queues work per server and lets a fixed pool of workers serve the servers round-robin, so a busy server can't starve quiet ones
+    """
+    
+    def __init__(self, client : "Client", workers : int = 8, max_queue : int = 100, overflow : Overflow = Overflow.DROP_OLDEST):
+        if workers <= 0 or max_queue <= 0: raise ValueError('The scheduler needs at least one worker and a positive queue size')
+        
+        self._client : "Client" = client
+        self._size : int = workers
+        self.max_queue : int = max_queue
+        self.overflow : Overflow = Overflow.convert(overflow)
+        self._queues : dict[int, collections.deque[tuple]] = {}
+        # Servers with queued work in the order they are served, a server is in here exactly while its queue is not empty
+        self._ready : collections.deque[int] = collections.deque()
+        self._waiters : dict[int, collections.deque[asyncio.Future]] = {}
+        self._available : asyncio.Semaphore = None
+        self._workers : list[asyncio.Task] = []
+        self.dropped : int = 0
+        
+        self.wait : Histogram = client.metrics.histogram('discord_scheduler_wait_seconds', 'Time work waited in the queue of its server')
+        client.metrics.gauge('discord_scheduler_queue_depth', 'Work waiting in all server queues', lambda: self.depth)
+        client.metrics.gauge('discord_scheduler_queue_depth_max', 'Work waiting in the longest server queue', lambda: max(map(len, list(self._queues.values())), default = 0))
+        client.metrics.gauge('discord_scheduler_dropped_total', 'Work dropped because a server queue was full', lambda: self.dropped, kind = 'counter')
+        
+    @property
+    def client(self) -> "Client":
+        return self._client
+    
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in list(self._queues.values()))
+    
+    @property
+    def running(self) -> bool:
+        return bool(self._workers)
+    
+    def start(self) -> None:
+        if self.running: return
+        self._available = asyncio.Semaphore(0)
+        self._workers = [asyncio.ensure_future(self._work()) for _ in range(self._size)]
+        
+    def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+    
+    async def submit(self, key : int, func : Callable[..., Awaitable[None]], *args, **kwargs) -> bool:
+        """
+        Queues ``func(*args, **kwargs)`` for the server ``key``, returns whether it was queued
+        """
+        if not self.running: self.start()
+        
+        queue = self._queues.setdefault(key, collections.deque())
+        while len(queue) >= self.max_queue:
+            match self.overflow:
+                case Overflow.DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                case Overflow.DROP_OLDEST:
+                    # The queue keeps its length and its place in the rotation, so nothing else changes
+                    queue.popleft()
+                    queue.append((time.perf_counter(), func, args, kwargs))
+                    self.dropped += 1
+                    return True
+                case Overflow.WAIT:
+                    waiter = asyncio.get_event_loop().create_future()
+                    self._waiters.setdefault(key, collections.deque()).append(waiter)
+                    await waiter
+                    queue = self._queues.setdefault(key, collections.deque())
+        
+        if not queue: self._ready.append(key)
+        queue.append((time.perf_counter(), func, args, kwargs))
+        self._available.release()
+        return True
+    
+    def _wake(self, key : int) -> None:
+        waiters = self._waiters.get(key)
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+        if waiters is not None and not waiters: del self._waiters[key]
+    
+    async def _work(self) -> None:
+        while True:
+            await self._available.acquire()
+            key = self._ready.popleft()
+            queue = self._queues[key]
+            enqueued, func, args, kwargs = queue.popleft()
+            if queue:
+                self._ready.append(key)
+            else:
+                del self._queues[key]
+            self._wake(key)
+            
+            self.wait.observe(time.perf_counter() - enqueued)
+            try:
+                await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await self.client.on_error(func.__name__, *args, **kwargs)
+
+
 class Events:
     
     def __init__(self, client : "Client"):
+        self._client : "Client" = client
         self._values : dict[Event, Collection] = {
             Event.ON_MESSAGE: Collection(client),
             Event.ON_COMMAND: Collection(client),
@@ -171,20 +419,87 @@ class Events:
             Event.ON_MEMBER_BAN: Collection(client),
             Event.ON_MEMBER_UNBAN: Collection(client)
         }
+        # Message handlers running after commands are kept apart, so each pass only touches its own handlers
+        self._after_command : Collection = Collection(client)
+        for event_type, collection in self._values.items():
+            collection.stat = client.metrics.event(event_type)
+        self._after_command.stat = self._values[Event.ON_MESSAGE].stat
+        self._scheduler : Scheduler = None
+        
+    @property
+    def client(self) -> "Client":
+        return self._client
         
     @property
     def values(self):
         return self._values
+    
+    @property
+    def scheduler(self) -> Scheduler:
+        return self._scheduler
+    
+    @scheduler.setter
+    def scheduler(self, scheduler : Scheduler) -> None:
+        if self._scheduler is not None: self._scheduler.stop()
+        self._scheduler = scheduler
+    
+    async def dispatch(self, key : int, func : Callable[..., Awaitable[None]], *args, **kwargs) -> None:
+        """
+        Runs ``func`` inline, or queues it for the server ``key`` if a scheduler is set
+        """
+        if self._scheduler is None:
+            await func(*args, **kwargs)
+        else:
+            await self._scheduler.submit(key, func, *args, **kwargs)
+    
+    def collection(self, event_type : Event, *args) -> Collection:
+        if event_type is Event.ON_MESSAGE and len(args) > 1 and args[1]: return self._after_command
+        try:
+            return self._values[event_type]
+        except KeyError:
+            raise ValueError(f'The event type {event_type} does not exist') from None
+    
+    def active(self, event_type : Event, *args) -> bool:
+        """
+        Whether any handler is registered, allows to skip an event before building its coroutine
+        """
+        return len(self.collection(event_type, *args)) > 0
         
     async def process(self, event_type : Event, *args, **kwargs) -> "Events":
-        if event_type not in self.values: raise ValueError(f'The event type {event_type} does not exist')
+        collection = self.collection(event_type, *args)
 
-        await self.values[event_type].process(*args, **kwargs)
+        start = time.perf_counter()
+        failed = True
+        try:
+            await collection.process(*args, **kwargs)
+            failed = False
+        finally:
+            collection.stat.record(time.perf_counter() - start, failed)
         
         return self
         
-    def add(self, coro : Awaitable[None], event_type : Event, *args, **kwargs):
-        if not asyncio.iscoroutinefunction(coro): raise TypeError('Event registered must be a coroutine function')
+    def add(self, coro : Awaitable[None] | Callable, event_type : Event, *args, offload : Offload = None, timeout : float = None, **kwargs):
+        '''
+        Every event accepts a scope, the handler only runs for events matching all given values
+        
+        guild : int | discord.Guild = None
+        channel : int | discord.abc.GuildChannel = None
+        author : int | list[int] = None
+        role : int | list[int] = None
+        
+        Plain functions run in the thread pool of ``client.executors``
+        Handlers always receive discord objects, which can't be pickled into the process pool, so CPU-bound work on plain data is passed to ``client.executors.run(func, *args, offload = Offload.PROCESS)`` from within the handler instead
+        
+        offload : Offload = Offload.THREAD
+        timeout : float = None
+        '''
+        if asyncio.iscoroutinefunction(coro):
+            if offload is not None or timeout is not None: raise TypeError('Only plain functions can be offloaded, coroutine functions run on the event loop')
+        elif callable(coro):
+            if offload is not None and Offload.convert(offload) == Offload.PROCESS: raise TypeError('Event handlers receive discord objects which cannot be sent to a process, use ``client.executors.run`` with plain data instead')
+            coro = self.client.executors.wrap(coro, offload or Offload.THREAD, timeout)
+        else:
+            raise TypeError('Event registered must be a function or coroutine function')
         if not isinstance(event_type, Event): raise TypeError(f"{event_type.__type__} is unequal {Event}.")
 
         match event_type:
@@ -192,6 +507,9 @@ class Events:
                 '''
                 permission : Auth = Auth.DEFAULT
                 restriction : Restriction = Restriction.NONE
+                requires_voice : bool = False
+                requires_library : bool = False
+                cooldown : Cooldown = None
                 
                 message : discord.Message
                 '''
@@ -207,27 +525,26 @@ class Events:
                 
                 message : discord.Message
                 '''
-                self.values[Event.ON_MESSAGE].add(
+                after_command = kwargs.get('after_command', args[1] if len(args) > 1 else False)
+                (self._after_command if after_command else self.values[Event.ON_MESSAGE]).add(
                     coro,
                     Event.ON_MESSAGE,
                     *args,
                     **kwargs
                 )
-            case Event.ON_REACTION_ADD:
+            case Event.ON_REACTION_ADD | Event.ON_REACTION_REMOVE:
                 '''
-                None
+                message : int | discord.Message = None
+                emoji : str | discord.Emoji | discord.PartialEmoji = None
                 
-                reaction : discord.Reaction
-                user : Union[discord.Member, discord.User]
+                payload : discord.RawReactionActionEvent
                 '''
-                self.values[Event.ON_REACTION_ADD].add(
+                self.values[event_type].add(
                     coro,
-                    Event.ON_REACTION_ADD,
+                    event_type,
                     *args,
                     **kwargs
                 )
-            case Event.ON_REACTION_REMOVE:
-                raise NotImplementedError(f"The event '{event_type.name}' is not implemented yet")
             case Event.ON_MEMBER_JOIN:
                 '''
                 None
@@ -0,0 +1,58 @@
+import asyncio, concurrent.futures, functools, multiprocessing
+
+from typing import Any, Awaitable, Callable
+
+from core.enums import Offload
+
+
+class Executors:
+    """
+    Shared thread and process pools to run plain functions without blocking the event loop
+    """
+
+    def __init__(self, threads : int = None, processes : int = None, timeout : float = None):
+        self._threads : int = threads
+        self._processes : int = processes
+        self.timeout : float = timeout
+        self._thread_pool : concurrent.futures.ThreadPoolExecutor = None
+        self._process_pool : concurrent.futures.ProcessPoolExecutor = None
+
+    def pool(self, offload : Offload = Offload.THREAD) -> concurrent.futures.Executor:
+        # Created on first use, most bots never need a process pool
+        match Offload.convert(offload):
+            case Offload.THREAD:
+                if self._thread_pool is None: self._thread_pool = concurrent.futures.ThreadPoolExecutor(self._threads, thread_name_prefix = 'offload')
+                return self._thread_pool
+            case Offload.PROCESS:
+                # Spawned instead of forked, the parent runs threads which must not be copied mid-operation
+                if self._process_pool is None: self._process_pool = concurrent.futures.ProcessPoolExecutor(self._processes, mp_context = multiprocessing.get_context('spawn'))
+                return self._process_pool
+
+    async def run(self, func : Callable, *args, offload : Offload = Offload.THREAD, timeout : float = None, **kwargs) -> Any:
+        """
+        Runs ``func(*args, **kwargs)`` in a pool and returns its result, exceptions are raised in the awaiting task
+        With ``Offload.PROCESS`` the function and its arguments must be picklable, so module level functions and plain data only
+        """
+        future = asyncio.get_running_loop().run_in_executor(self.pool(offload), functools.partial(func, *args, **kwargs))
+        timeout = self.timeout if timeout is None else timeout
+        if timeout is None: return await future
+        # A running thread can't be interrupted, on timeout only the result is discarded
+        return await asyncio.wait_for(future, timeout)
+
+    def wrap(self, func : Callable, offload : Offload = Offload.THREAD, timeout : float = None) -> Callable[..., Awaitable[Any]]:
+        """
+        Coroutine function running ``func`` in a pool, keeps the name of ``func`` for the metrics
+        """
+        offload = Offload.convert(offload)
+
+        @functools.wraps(func)
+        async def offloaded(*args, **kwargs):
+            return await self.run(func, *args, offload = offload, timeout = timeout, **kwargs)
+
+        return offloaded
+
+    def shutdown(self, wait : bool = False) -> None:
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None: pool.shutdown(wait = wait, cancel_futures = True)
+        self._thread_pool = None
+        self._process_pool = None
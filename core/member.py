@@ -12,6 +12,8 @@ class Member:
     The server object of a discord user
     """
     
+    __slots__ = ('_user', '_server', '_permission')
+    
     def __init__(self, user : User, server : "Server", permission : Auth = Auth.DEFAULT):
         self._user : User = user
         self._server : "Server" = server
@@ -39,6 +41,7 @@ class Member:
         
         self.server.database.update_member(self, 'permission', auth.value)
         self._permission = auth
+        self.server.client.roles.invalidate(self.server.id, self.id)
         
     def has_permission(self, permission: Auth) -> bool:
         return self.permission.value >= permission.value
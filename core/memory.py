@@ -0,0 +1,122 @@
+import discord, sys
+
+from typing import TYPE_CHECKING, Any, Iterable, Mapping
+
+if TYPE_CHECKING:
+    from core.client import Client
+
+try:
+    import resource
+except ImportError:
+    # Not available on windows, the peak resident size is skipped there
+    resource = None
+
+
+def _flags(cls : type, value : str | list[str] | Mapping[str, bool], base : discord.flags.BaseFlags) -> discord.flags.BaseFlags:
+    if isinstance(value, str):
+        match value.lower():
+            case 'all':
+                return cls.all()
+            case 'none':
+                return cls.none()
+            case 'default':
+                return base
+            case _:
+                raise ValueError(f"Unknown value '{value}' for {cls.__name__}, use 'all', 'none', 'default' or a list of {', '.join(cls.VALID_FLAGS)}")
+
+    flags = cls.none() if not isinstance(value, Mapping) else base
+    for name, enabled in (value.items() if isinstance(value, Mapping) else ((name, True) for name in value)):
+        if name not in cls.VALID_FLAGS: raise ValueError(f"Unknown flag '{name}' for {cls.__name__}, use one of {', '.join(cls.VALID_FLAGS)}")
+        setattr(flags, name, bool(enabled))
+    return flags
+
+
+def options(profile : Mapping[str, Any]) -> dict[str, Any]:
+    """
+    Translates the memory section of the configuration into ``discord.Client`` options, missing keys keep the discord.py defaults
+
+    max_messages : int = 1000, 0 disables the message cache
+    intents : str | list[str] | dict[str, bool] = 'default'
+    member_cache : str | list[str] | dict[str, bool] = 'from_intents'
+    chunk_guilds_at_startup : bool = intents.members
+    """
+    result = {}
+    if 'max_messages' in profile:
+        result['max_messages'] = profile['max_messages'] or None
+
+    intents = discord.Intents.default()
+    if profile.get('intents') is not None:
+        intents = result['intents'] = _flags(discord.Intents, profile['intents'], discord.Intents.default())
+
+    member_cache = profile.get('member_cache')
+    if member_cache is not None and member_cache != 'from_intents':
+        result['member_cache_flags'] = _flags(discord.MemberCacheFlags, member_cache, discord.MemberCacheFlags.from_intents(intents))
+
+    if profile.get('chunk_guilds_at_startup') is not None:
+        result['chunk_guilds_at_startup'] = bool(profile['chunk_guilds_at_startup'])
+    return result
+
+
+def _estimate(objects : Iterable[object], count : int, samples : int = 100) -> int:
+    """
+    Approximate bytes of ``count`` objects, from the shallow size of a sample and its attribute values
+    """
+    total = 0
+    taken = 0
+    for obj in objects:
+        if taken >= samples: break
+        size = sys.getsizeof(obj)
+        values = getattr(obj, '__dict__', None)
+        if values is not None:
+            size += sys.getsizeof(values)
+            values = values.values()
+        else:
+            values = (getattr(obj, slot, None) for cls in type(obj).__mro__ for slot in getattr(cls, '__slots__', ()))
+        # Shared objects are counted for every reference, good enough for an estimate
+        size += sum(sys.getsizeof(value) for value in values if value is not None and not isinstance(value, bool))
+        total += size
+        taken += 1
+    return total * count // taken if taken else 0
+
+
+def cache_sizes(client : "Client") -> dict[str, tuple[int, int]]:
+    """
+    Entries and approximate bytes of the discord.py caches and the caches of the client
+    """
+    connection = client._connection
+    guilds = list(connection._guilds.values())
+    members = [member for guild in guilds for member in guild._members.values()]
+    channels = [channel for guild in guilds for channel in guild._channels.values()]
+    messages = list(connection._messages) if connection._messages is not None else []
+    users = list(connection._users.values())
+    emojis = list(connection._emojis.values())
+    bot_members = [member for server in client.servers for member in server.members]
+
+    return {
+        'guilds': (len(guilds), _estimate(guilds, len(guilds))),
+        'channels': (len(channels), _estimate(channels, len(channels))),
+        'members': (len(members), _estimate(members, len(members))),
+        'users': (len(users), _estimate(users, len(users))),
+        'messages': (len(messages), _estimate(messages, len(messages))),
+        'emojis': (len(emojis), _estimate(emojis, len(emojis))),
+        'bot users': (len(client.users), _estimate(client.users, len(client.users))),
+        'bot members': (len(bot_members), _estimate(bot_members, len(bot_members))),
+        'tracks': (len(client.music.tracks), _estimate(client.music.tracks, len(client.music.tracks))),
+        'mapped clips': (client.clips.count, client.clips.mapped),
+        'cooldowns': (len(client.cooldowns), 0),
+        'outbox': (client.outbox.pending, 0)
+    }
+
+
+def report(client : "Client") -> str:
+    sizes = cache_sizes(client)
+    lines = [f'{"cache":<16} {"entries":>10} {"approx":>12}']
+    for name, (entries, size) in sizes.items():
+        lines.append(f'{name:<16} {entries:>10} {size / 1024:>10.1f}KB')
+    lines.append(f'{"total":<16} {sum(entries for entries, _ in sizes.values()):>10} {sum(size for _, size in sizes.values()) / 1024:>10.1f}KB')
+
+    if resource is not None:
+        # ru_maxrss is reported in kilobytes on linux and bytes on macos
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        lines.append(f'peak resident size {peak / 1024 if sys.platform != "darwin" else peak / 1024 ** 2:.1f}MB')
+    return '\n'.join(lines)
@@ -0,0 +1,258 @@
+import bisect, contextlib, os, threading, time
+
+from typing import Callable, Iterator
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from core.enums import Event
+
+# Upper bounds in seconds, everything above the last bound lands in +Inf
+BUCKETS : tuple[float] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DISCORD_EPOCH : int = 1420070400000
+
+
+class Histogram:
+
+    def __init__(self, buckets : tuple[float] = BUCKETS):
+        self.buckets : tuple[float] = buckets
+        self.counts : list[int] = [0] * (len(buckets) + 1)
+        self.count : int = 0
+        self.sum : float = 0.0
+
+    def observe(self, value : float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q : float) -> float:
+        """
+        Upper bound of the bucket containing the quantile ``q``
+        """
+        if self.count == 0: return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            if cumulative >= rank: return bound
+        return float('inf')
+
+    def exposition(self, name : str, labels : str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels}{"," if labels else ""}le="{le}"}} {cumulative}')
+        suffix = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}_sum{suffix} {self.sum}')
+        lines.append(f'{name}_count{suffix} {self.count}')
+        return lines
+
+
+class Stat:
+    """
+    Call count, error count and latency histogram of one handler or event type
+    """
+
+    def __init__(self):
+        self.calls : int = 0
+        self.errors : int = 0
+        self.latency : Histogram = Histogram()
+
+    def record(self, duration : float, failed : bool = False) -> None:
+        self.calls += 1
+        if failed: self.errors += 1
+        self.latency.observe(duration)
+
+
+class Timeline:
+    """
+    Start and end of the startup phases, relative to the creation of the timeline
+    """
+
+    def __init__(self):
+        self.origin : float = time.perf_counter()
+        self.phases : dict[str, list[float]] = {}
+        self._lock : threading.Lock = threading.Lock()
+
+    def start(self, name : str) -> None:
+        with self._lock:
+            self.phases[name] = [time.perf_counter() - self.origin, None]
+
+    def finish(self, name : str) -> bool:
+        """
+        Ends the phase ``name``, returns whether it was the last running one
+        """
+        with self._lock:
+            phase = self.phases.get(name)
+            if phase is None or phase[1] is not None: return False
+            phase[1] = time.perf_counter() - self.origin
+            return all(end is not None for _, end in self.phases.values())
+
+    def finished(self, name : str) -> bool:
+        phase = self.phases.get(name)
+        return phase is not None and phase[1] is not None
+
+    @contextlib.contextmanager
+    def phase(self, name : str) -> Iterator[None]:
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.finish(name)
+
+    def report(self) -> str:
+        lines = [f'{"phase":<12} {"start":>9} {"took":>9}']
+        for name, (start, end) in sorted(self.phases.items(), key = lambda item: item[1][0]):
+            lines.append(f'{name:<12} {start:>8.3f}s {f"{end - start:.3f}s" if end is not None else "running":>9}')
+        ends = [end for _, end in self.phases.values() if end is not None]
+        if ends: lines.append(f'{"total":<12} {"":>9} {max(ends):>8.3f}s')
+        return '\n'.join(lines)
+
+
+class Metrics:
+    """
+    Collects dispatch statistics and exposes them for the console and prometheus
+    """
+
+    def __init__(self):
+        self._handlers : dict[tuple[str, str], Stat] = {}
+        self._events : dict[str, Stat] = {}
+        self._gateway_delay : Histogram = Histogram()
+        self._histograms : dict[str, tuple[str, Histogram]] = {}
+        self._gauges : dict[str, tuple[str, str, Callable[[], float]]] = {}
+        self._server : ThreadingHTTPServer = None
+        self._exporter : threading.Thread = None
+
+    @property
+    def handlers(self) -> dict[tuple[str, str], Stat]:
+        return self._handlers
+
+    @property
+    def events(self) -> dict[str, Stat]:
+        return self._events
+
+    @property
+    def gateway_delay(self) -> Histogram:
+        return self._gateway_delay
+
+    def handler(self, event_type : Event, name : str) -> Stat:
+        key = (event_type.name, name)
+        if key not in self.handlers: self.handlers[key] = Stat()
+        return self.handlers[key]
+
+    def event(self, event_type : Event) -> Stat:
+        if event_type.name not in self.events: self.events[event_type.name] = Stat()
+        return self.events[event_type.name]
+
+    def histogram(self, name : str, description : str) -> Histogram:
+        if name not in self._histograms: self._histograms[name] = (description, Histogram())
+        return self._histograms[name][1]
+
+    def gauge(self, name : str, description : str, collect : Callable[[], float], kind : str = 'gauge') -> None:
+        """
+        ``collect`` is called on every exposition, so values owned by other components are never copied
+        """
+        self._gauges[name] = (description, kind, collect)
+
+    def observe_snowflake(self, snowflake : int) -> None:
+        """
+        Records the delay between the creation of a discord object and now
+        """
+        created = ((snowflake >> 22) + DISCORD_EPOCH) / 1000
+        self.gateway_delay.observe(max(time.time() - created, 0.0))
+
+    def summary(self) -> str:
+        lines = [f'{"handler":<40} {"calls":>8} {"errors":>7} {"mean":>9} {"p50":>9} {"p99":>9}']
+        for (event_name, name), stat in sorted(self.handlers.items(), key = lambda item: -item[1].latency.sum):
+            lines.append(f'{f"{event_name}:{name}":<40} {stat.calls:>8} {stat.errors:>7} {stat.latency.mean * 1000:>7.2f}ms {stat.latency.quantile(0.5) * 1000:>7.1f}ms {stat.latency.quantile(0.99) * 1000:>7.1f}ms')
+        for event_name, stat in sorted(self.events.items()):
+            lines.append(f'{event_name:<40} {stat.calls:>8} {stat.errors:>7} {stat.latency.mean * 1000:>7.2f}ms {stat.latency.quantile(0.5) * 1000:>7.1f}ms {stat.latency.quantile(0.99) * 1000:>7.1f}ms')
+        for name, (description, histogram) in sorted(self._histograms.items()):
+            lines.append(f'{name:<40} {histogram.count:>8} {"":>7} {histogram.mean * 1000:>7.2f}ms {histogram.quantile(0.5) * 1000:>7.1f}ms {histogram.quantile(0.99) * 1000:>7.1f}ms')
+        for name, (description, kind, collect) in sorted(self._gauges.items()):
+            lines.append(f'{name:<40} {collect():>8}')
+        lines.append(f'{"gateway delay":<40} {self.gateway_delay.count:>8} {"":>7} {self.gateway_delay.mean * 1000:>7.2f}ms {self.gateway_delay.quantile(0.5) * 1000:>7.1f}ms {self.gateway_delay.quantile(0.99) * 1000:>7.1f}ms')
+        return '\n'.join(lines)
+
+    def exposition(self) -> str:
+        lines = [
+            '# HELP discord_handler_calls_total Calls of a registered handler',
+            '# TYPE discord_handler_calls_total counter'
+        ]
+        for (event_name, name), stat in self.handlers.items():
+            lines.append(f'discord_handler_calls_total{{event="{event_name}",handler="{name}"}} {stat.calls}')
+        lines += [
+            '# HELP discord_handler_errors_total Calls of a registered handler that raised an exception',
+            '# TYPE discord_handler_errors_total counter'
+        ]
+        for (event_name, name), stat in self.handlers.items():
+            lines.append(f'discord_handler_errors_total{{event="{event_name}",handler="{name}"}} {stat.errors}')
+        lines += [
+            '# HELP discord_handler_latency_seconds Latency of a registered handler',
+            '# TYPE discord_handler_latency_seconds histogram'
+        ]
+        for (event_name, name), stat in self.handlers.items():
+            lines += stat.latency.exposition('discord_handler_latency_seconds', f'event="{event_name}",handler="{name}"')
+        lines += [
+            '# HELP discord_event_latency_seconds Latency of dispatching an event to all of its handlers',
+            '# TYPE discord_event_latency_seconds histogram'
+        ]
+        for event_name, stat in self.events.items():
+            lines += stat.latency.exposition('discord_event_latency_seconds', f'event="{event_name}"')
+        lines += [
+            '# HELP discord_gateway_delay_seconds Delay between creation of a message and its dispatch',
+            '# TYPE discord_gateway_delay_seconds histogram'
+        ]
+        lines += self.gateway_delay.exposition('discord_gateway_delay_seconds', '')
+        for name, (description, histogram) in self._histograms.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            lines += histogram.exposition(name, '')
+        for name, (description, kind, collect) in self._gauges.items():
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}', f'{name} {collect()}']
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path : str) -> None:
+        # Write then rename, so scrapers never read a half written file
+        with open(f'{path}.tmp', 'w') as outfile:
+            outfile.write(self.exposition())
+        os.replace(f'{path}.tmp', path)
+
+    def export(self, path : str, interval : float = 15.0) -> threading.Thread:
+        if self._exporter is not None: raise RuntimeError('The metrics are already exported to a file!')
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.write(path)
+
+        self._exporter = threading.Thread(target = loop, name = 'metrics-exporter')
+        self._exporter.daemon = True
+        self._exporter.start()
+        return self._exporter
+
+    def serve(self, port : int, host : str = '127.0.0.1') -> ThreadingHTTPServer:
+        if self._server is not None: raise RuntimeError('The metrics are already served!')
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.exposition().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target = self._server.serve_forever, name = 'metrics-server')
+        thread.daemon = True
+        thread.start()
+        return self._server
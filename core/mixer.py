@@ -0,0 +1,178 @@
+import itertools, threading
+
+import discord
+import numpy as np
+
+from typing import Callable
+
+FRAME_SIZE : int = discord.opus.Encoder.FRAME_SIZE
+SAMPLES : int = FRAME_SIZE // 2
+# Per frame the limiter gain may recover by this factor, about a quarter second from -6dB back to unity
+RELEASE : float = 1.06
+# Sources a mixer sums at most, every further one replaces the oldest
+MAX_INPUTS : int = 16
+
+
+class Input:
+    """
+    A pcm source mixed with a gain in dB, ``after`` is called from the voice thread once it ended
+    """
+
+    def __init__(self, source : discord.AudioSource, gain : float = 0.0, after : Callable[[], None] = None):
+        if source.is_opus(): raise ValueError('Only pcm sources can be mixed, opus frames would have to be decoded first')
+        self.source : discord.AudioSource = source
+        self.gain : float = gain or 0.0
+        self.after : Callable[[], None] = after
+
+    @property
+    def gain(self) -> float:
+        return self._gain
+
+    @gain.setter
+    def gain(self, gain : float) -> None:
+        self._gain = gain
+        self.factor = 10 ** (gain / 20)
+
+    def cleanup(self) -> None:
+        self.source.cleanup()
+        if self.after is not None: self.after()
+
+
+class Mixer(discord.AudioSource):
+    """
+    Sums any number of pcm sources into a single 20ms frame, so a server needs one player and one encoder for all of them
+    Inputs are added and removed from any thread, the mixer ends once its last input ended
+    At most ``max_inputs`` sources are mixed, adding another one drops the oldest so spamming sounds can't grow a frame without bound
+    """
+
+    def __init__(self, max_inputs : int = MAX_INPUTS):
+        if max_inputs < 1: raise ValueError('A mixer needs room for at least one input')
+        self.max_inputs : int = max_inputs
+        self._inputs : dict[int, Input] = {}
+        self._handles : itertools.count = itertools.count()
+        self._lock : threading.Lock = threading.Lock()
+        self._closed : bool = False
+        self._limiter : float = 1.0
+        self._buffer : np.ndarray = np.empty((0, SAMPLES), dtype = np.int16)
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def __len__(self) -> int:
+        return len(self._inputs)
+
+    def add(self, source : discord.AudioSource, gain : float = 0.0, after : Callable[[], None] = None) -> int:
+        """
+        Starts mixing ``source`` with the next frame, returns the handle to change its gain or remove it
+        Drops the oldest inputs if the mixer is full
+        """
+        mixed = Input(source, gain, after)
+        dropped = []
+        with self._lock:
+            if self._closed: raise RuntimeError('The mixer already ended, play a new one')
+            while len(self._inputs) >= self.max_inputs:
+                # Inputs are kept in the order they were added
+                dropped.append(self._inputs.pop(next(iter(self._inputs))))
+            handle = next(self._handles)
+            self._inputs[handle] = mixed
+        for old in dropped:
+            old.cleanup()
+        return handle
+
+    def remove(self, handle : int) -> bool:
+        with self._lock:
+            mixed = self._inputs.pop(handle, None)
+        if mixed is None: return False
+        mixed.cleanup()
+        return True
+
+    def set_gain(self, handle : int, gain : float) -> bool:
+        with self._lock:
+            mixed = self._inputs.get(handle)
+            if mixed is None: return False
+            mixed.gain = gain
+            return True
+
+    def read(self) -> bytes:
+        with self._lock:
+            inputs = list(self._inputs.items())
+            if not inputs:
+                self._closed = True
+                return b''
+
+        if len(self._buffer) != len(inputs): self._buffer = np.zeros((len(inputs), SAMPLES), dtype = np.int16)
+        factors = np.empty(len(inputs), dtype = np.float32)
+        ended = []
+        for row, (handle, mixed) in enumerate(inputs):
+            data = mixed.source.read()
+            frame = np.frombuffer(data, dtype = np.int16, count = min(len(data), FRAME_SIZE) // 2)
+            self._buffer[row, :len(frame)] = frame
+            if len(frame) < SAMPLES:
+                self._buffer[row, len(frame):] = 0
+                ended.append(handle)
+            factors[row] = mixed.factor
+
+        # One matrix product weighs and sums all inputs
+        mixed = factors @ self._buffer.astype(np.float32)
+        # Loud sums are turned down at once and recover slowly, the clip only catches what is left
+        peak = float(np.abs(mixed).max())
+        self._limiter = min(self._limiter * RELEASE, 1.0, 32767 / peak if peak > 0 else 1.0)
+        if self._limiter < 1.0: mixed *= self._limiter
+        np.clip(mixed, -32768, 32767, out = mixed)
+
+        for handle in ended:
+            self.remove(handle)
+        return mixed.astype(np.int16).tobytes()
+
+    def cleanup(self) -> None:
+        with self._lock:
+            self._closed = True
+            inputs, self._inputs = list(self._inputs.values()), {}
+        for mixed in inputs:
+            mixed.cleanup()
+
+
+class Mixers:
+    """
+    The mixer of every server, created when a server plays its first sound and replaced after it ended
+    """
+
+    def __init__(self, max_inputs : int = MAX_INPUTS):
+        self.max_inputs : int = max_inputs
+        self._mixers : dict[int, Mixer] = {}
+
+    def __len__(self) -> int:
+        return len(self._mixers)
+
+    def get(self, guild_id : int) -> Mixer:
+        return self._mixers.get(guild_id)
+
+    def play(self, voice_client : discord.VoiceClient, source : discord.AudioSource, gain : float = 0.0, after : Callable[[], None] = None) -> tuple[Mixer, int]:
+        """
+        Mixes ``source`` into the playback of the server, starts a mixer if nothing is playing
+        Must be called from the event loop, returns the mixer and the handle of the source
+        """
+        guild_id = voice_client.guild.id
+        mixer = self._mixers.get(guild_id)
+        if mixer is not None and not mixer.closed and voice_client.source is mixer:
+            try:
+                return mixer, mixer.add(source, gain, after)
+            except RuntimeError:
+                # Ended between the check and adding the source
+                pass
+
+        if voice_client.is_playing() or voice_client.is_paused(): voice_client.stop()
+        mixer = self._mixers[guild_id] = Mixer(self.max_inputs)
+        handle = mixer.add(source, gain, after)
+        # The player thread calls ``after``, the mixers are only ever changed on the event loop
+        voice_client.play(mixer, after = lambda error: voice_client.loop.call_soon_threadsafe(self._ended, guild_id, mixer, error))
+        return mixer, handle
+
+    def _ended(self, guild_id : int, mixer : Mixer, error : Exception) -> None:
+        if error is not None: print(f"Playback of server '{guild_id}' failed: {error}")
+        if self._mixers.get(guild_id) is mixer: del self._mixers[guild_id]
+
+    def stop(self, guild_id : int) -> None:
+        mixer = self._mixers.pop(guild_id, None)
+        if mixer is not None: mixer.cleanup()
@@ -1,13 +1,34 @@
-import glob, uuid, os, json, random, difflib, hashlib
+import collections, concurrent.futures, dataclasses, glob, uuid, os, json, random, difflib, hashlib, sys, threading, types
+
+from typing import TYPE_CHECKING, Callable
+
+from core import loudness, tags
+
+if TYPE_CHECKING:
+    from core.executor import Executors
+
+# Formats with ID3 tags or vorbis comments
+EXTENSIONS : tuple[str] = ('mp3', 'ogg', 'opus', 'flac')
 
 class Track:
     
-    def __init__(self, name : str, path : str, description : str = "", reference : uuid.UUID = None):
+    __slots__ = ('_reference', '_name', '_description', '_path', '_hash', '_artist', '_album', '_title', '_duration', '_mtime', '_size', '_gain')
+    
+    def __init__(self, name : str, path : str, description : str = "", reference : uuid.UUID = None, checksum : str = None, artist : str = None, album : str = None, title : str = None, duration : float = None, mtime : int = None, size : int = None, gain : float = None):
         self._reference = reference or uuid.uuid4()
         self._name = name
-        self._description = description
+        # Descriptions repeat across a library, interning keeps a single copy of each
+        self._description = sys.intern(description) if description is not None else None
         self._path = path
-        self._hash = self.md5().hexdigest()
+        self._hash = checksum or self.md5().hexdigest()
+        # Artists and albums repeat as well
+        self._artist = sys.intern(artist) if artist else None
+        self._album = sys.intern(album) if album else None
+        self._title = title
+        self._duration = duration
+        self._mtime = mtime
+        self._size = size
+        self._gain = gain
     
     @property
     def reference(self) -> uuid.UUID:
@@ -28,6 +49,56 @@ class Track:
     @property
     def hash(self) -> str:
         return self._hash
+    
+    @property
+    def artist(self) -> str:
+        return self._artist
+    
+    @property
+    def album(self) -> str:
+        return self._album
+    
+    @property
+    def title(self) -> str:
+        return self._title
+    
+    @property
+    def duration(self) -> float:
+        return self._duration
+    
+    @property
+    def mtime(self) -> int:
+        return self._mtime
+    
+    @property
+    def size(self) -> int:
+        return self._size
+    
+    @property
+    def gain(self) -> float:
+        """
+        Gain in dB normalizing the loudness of the track, ``None`` until it was analysed
+        """
+        return self._gain
+    
+    @gain.setter
+    def gain(self, gain : float) -> None:
+        # Written once by the analysis, a single attribute so snapshots sharing the track stay consistent
+        self._gain = gain
+    
+    @property
+    def search_keys(self) -> tuple[str]:
+        """
+        Texts a search for this track is matched against
+        """
+        keys = [self.name]
+        if self.title: keys.append(self.title)
+        if self.artist and self.title: keys.append(f"{self.artist} {self.title}")
+        if self.album: keys.append(self.album)
+        return tuple(dict.fromkeys(keys))
+    
+    def unchanged(self, stat : os.stat_result) -> bool:
+        return self.mtime == stat.st_mtime_ns and self.size == stat.st_size
 
     def __eq__(self, track : "Track") -> bool:
         if not isinstance(track, Track): return False
@@ -50,7 +121,14 @@ class Track:
             "name": self.name,
             "description": self.description,
             "path": self.path,
-            "checksum": self.hash
+            "checksum": self.hash,
+            "artist": self.artist,
+            "album": self.album,
+            "title": self.title,
+            "duration": self.duration,
+            "mtime": self.mtime,
+            "size": self.size,
+            "gain": self.gain
         }
     
     @staticmethod
@@ -59,16 +137,27 @@ class Track:
             name = data['name'],
             description = data['description'],
             path = data['path'],
-            reference = uuid.UUID(data["reference"])
+            reference = uuid.UUID(data["reference"]),
+            # Stored checksums spare rehashing every file, ``scan`` notices changed files by size and modification time
+            checksum = data.get('checksum'),
+            artist = data.get('artist'),
+            album = data.get('album'),
+            title = data.get('title'),
+            duration = data.get('duration'),
+            mtime = data.get('mtime'),
+            size = data.get('size'),
+            gain = data.get('gain')
         )
 
 class Playlist:
     
-    def __init__(self, name : str, description : str = "", tracks : list[Track] = [], reference : uuid.UUID = None):
+    __slots__ = ('_reference', '_name', '_description', '_tracks')
+    
+    def __init__(self, name : str, description : str = "", tracks : list[Track] = None, reference : uuid.UUID = None):
         self._reference = reference or uuid.uuid4()
         self._name = name
         self._description = description
-        self._tracks = tracks
+        self._tracks = [] if tracks is None else tracks
     
     @property
     def reference(self) -> uuid.UUID:
@@ -112,20 +201,33 @@ class Playlist:
             "tracks": [track.reference.hex for track in self.tracks]
         }
     
-    def load(self, tracks : list[Track]):
-        update = []
-        for track in self._tracks:
-            if isinstance(track, uuid.UUID):
-                found = None
-                for _track in tracks:
-                    if _track.reference == track:
-                        found = _track
-                        break
-                if found is not None:
-                    update.append(found)
-                    continue
-            update.append(track)
-        self._tracks = update
+    def _resolve(self, tracks : list[Track] | types.MappingProxyType, refresh : bool) -> list[Track]:
+        if not refresh and not any(isinstance(track, uuid.UUID) for track in self._tracks): return None
+        references = tracks if isinstance(tracks, (dict, types.MappingProxyType)) else {track.reference: track for track in tracks}
+        return [references.get(track if isinstance(track, uuid.UUID) else track.reference, track) if refresh or isinstance(track, uuid.UUID) else track for track in self._tracks]
+    
+    def load(self, tracks : list[Track] | types.MappingProxyType, refresh : bool = False):
+        """
+        Replaces unloaded track references with ``tracks``, a list or a mapping of references to tracks
+        With ``refresh`` loaded tracks are replaced by the track of the same reference as well
+        Changes this playlist, so only for playlists no published library contains yet, see ``loaded``
+        """
+        resolved = self._resolve(tracks, refresh)
+        # Swapped as a whole, readers of the old list never see a half loaded playlist
+        if resolved is not None: self._tracks = resolved
+    
+    def loaded(self, tracks : list[Track] | types.MappingProxyType, refresh : bool = False) -> "Playlist":
+        """
+        Like ``load``, but returns a new playlist with the same reference and leaves this one unchanged
+        Older library snapshots keep referencing this playlist, so their readers keep seeing its tracks
+        """
+        resolved = self._resolve(tracks, refresh)
+        if resolved is None or all(new is old for new, old in zip(resolved, self._tracks)): return self
+        return Playlist(name = self._name, description = self._description, tracks = resolved, reference = self._reference)
+    
+    @property
+    def references(self) -> tuple[uuid.UUID]:
+        return tuple(track if isinstance(track, uuid.UUID) else track.reference for track in self._tracks)
     
     @staticmethod
     def construct(data : dict) -> "Playlist":
@@ -137,34 +239,104 @@ class Playlist:
         )
         
             
+@dataclasses.dataclass(frozen = True)
+class Library:
+    """
+    Immutable state of the music library, replaced as a whole on every change
+    """
+    
+    tracks : tuple[Track]
+    playlists : tuple[Playlist]
+    references : types.MappingProxyType
+    checksums : types.MappingProxyType
+    paths : types.MappingProxyType
+    names : types.MappingProxyType
+    keys : tuple[tuple[str, Track]]
+    playlist_names : types.MappingProxyType
+    # Counts the published snapshots, results cached for an older generation are stale
+    generation : int
+    
+    @staticmethod
+    def construct(tracks : list[Track], playlists : list[Playlist], generation : int = 0) -> "Library":
+        # File names, titles, artists and albums, each pointing to the first track it belongs to
+        keys = tuple((key, track) for track in tracks for key in track.search_keys)
+        names = {}
+        for key, track in keys:
+            names.setdefault(key, track)
+        playlist_names = {}
+        for playlist in playlists:
+            playlist_names.setdefault(playlist.name, playlist)
+        
+        return Library(
+            tracks = tuple(tracks),
+            playlists = tuple(playlists),
+            references = types.MappingProxyType({obj.reference: obj for obj in (*tracks, *playlists)}),
+            checksums = types.MappingProxyType({track.hash: track for track in tracks}),
+            paths = types.MappingProxyType({track.path: track for track in tracks}),
+            names = types.MappingProxyType(names),
+            keys = keys,
+            playlist_names = types.MappingProxyType(playlist_names),
+            generation = generation
+        )
+        
+            
 class Music:
+    """
+    Publishes the library as immutable snapshots, readers never lock and writers swap in a new snapshot when done
+    """
     
-    def __init__(self, playlists : list[Playlist] = [], tracks : list[Track] = []):
-        self._playlists = playlists
+    def __init__(self, playlists : list[Playlist] = None, tracks : list[Track] = None, cache_size : int = 1024):
+        # Fresh lists per instance, mutable defaults would be shared between all Music objects
+        playlists = [] if playlists is None else playlists
+        tracks = [] if tracks is None else tracks
         
         # Load missing tracks from playlists into tracklist
         print("Checking for missing tracks in playlist")
+        # Tracks are equal by checksum, a set keeps this linear for big playlists
+        checksums = {track.hash for track in tracks}
         for playlist in playlists:
             for track in playlist.tracks:
                 if not isinstance(track, Track): continue
-                if track not in tracks:
+                if track.hash not in checksums:
                     print("Detected a track in playlist that is missing in tracklist, copying into tracks list")
                     tracks.append(track)
-                    
-        self._tracks = tracks
+                    checksums.add(track.hash)
 
         print("Loading unloaded tracks into playlist")
-        for playlist in self.playlists: 
-            playlist.load(self.tracks)
+        for playlist in playlists: 
+            playlist.load(tracks)
         print("Finished loading unloaded tracks")
         
+        self._library : Library = Library.construct(tracks, playlists)
+        self._lock : threading.Lock = threading.Lock()
+        self._loaded : threading.Event = threading.Event()
+        self._loaded.set()
+        
+        self._searches : collections.OrderedDict[str, Track] = collections.OrderedDict()
+        self._searches_generation : int = self._library.generation
+        self._searches_lock : threading.Lock = threading.Lock()
+        self.cache_size : int = cache_size
+        self.hits : int = 0
+        self.misses : int = 0
+        
+    @property
+    def library(self) -> Library:
+        return self._library
+        
+    @property
+    def loading(self) -> bool:
+        return not self._loaded.is_set()
+    
+    def wait_loaded(self, timeout : float = None) -> bool:
+        return self._loaded.wait(timeout)
+        
     @property
-    def playlists(self) -> list[Playlist]:
-        return self._playlists
+    def playlists(self) -> tuple[Playlist]:
+        return self._library.playlists
     
     @property
-    def tracks(self) -> list[Track]:
-        return self._tracks
+    def tracks(self) -> tuple[Track]:
+        return self._library.tracks
     
     def random_track(self) -> Track:
         return random.choice(self.tracks)
@@ -173,39 +345,131 @@ class Music:
         return random.choice(self.playlists)
     
     def search_track(self, title : str) -> Track:
-        if len(self.tracks) == 0: return
+        """
+        Finds the track matching ``title`` best, results are cached per library generation
+        """
+        library = self._library
+        title = ' '.join(title.split())
+        if len(library.tracks) == 0 or not title: return
+        
+        track = self._cached(library, title)
+        return track if track is not None else self._search(library, title)
+    
+    async def find_track(self, title : str, executors : "Executors") -> Track:
+        """
+        Like ``search_track`` for the event loop, only a fuzzy match of a query missing in the cache runs in the thread pool of ``executors``
+        """
+        library = self._library
+        title = ' '.join(title.split())
+        if len(library.tracks) == 0 or not title: return
+        
+        track = self._cached(library, title)
+        if track is not None: return track
+        if title in library.names: return self._search(library, title)
+        return await executors.run(self._search, library, title)
+    
+    def _cached(self, library : Library, title : str) -> Track:
+        with self._searches_lock:
+            if library.generation > self._searches_generation:
+                self._searches.clear()
+                self._searches_generation = library.generation
+            # A search still holding an older snapshot neither reads nor fills the cache
+            track = self._searches.get(title) if library.generation == self._searches_generation else None
+            if track is not None:
+                self._searches.move_to_end(title)
+                self.hits += 1
+                return track
+            self.misses += 1
+        return None
+    
+    def _search(self, library : Library, title : str) -> Track:
+        # Matched outside the lock, concurrent misses of the same query compute the same result
+        track = self._match_track(library, title)
+        with self._searches_lock:
+            if self._searches_generation == library.generation and track is not None:
+                self._searches[title] = track
+                if len(self._searches) > self.cache_size: self._searches.popitem(last = False)
+        return track
+    
+    @staticmethod
+    def _match_track(library : Library, title : str) -> Track:
+        if title in library.names: return library.names[title]
         min_diff = (0,0)
-        for track in self.tracks:
-            curr_diff = difflib.SequenceMatcher(None, title, track.name).ratio()
+        for key, track in library.keys:
+            curr_diff = difflib.SequenceMatcher(None, title, key).ratio()
             if curr_diff > min_diff[0]:
                 min_diff = (curr_diff, track)
         return min_diff[1]
     
     def search_playlist(self, title : str) -> Playlist:
-        if len(self.playlists) == 0: return
+        library = self._library
+        if len(library.playlists) == 0: return
+        if title in library.playlist_names: return library.playlist_names[title]
         min_diff = (0,0)
-        for playlist in self.playlists:
+        for playlist in library.playlists:
             curr_diff = difflib.SequenceMatcher(None, title, playlist.name).ratio()
             if curr_diff > min_diff[0]:
                 min_diff = (curr_diff, playlist)
         return min_diff[1]
     
+    def extend(self, objs : list[Track | Playlist]) -> Library:
+        """
+        Builds a snapshot with all new ``objs`` added and swaps it in, writers are serialized while readers keep their snapshot
+        """
+        if any(not (isinstance(obj, Track) or isinstance(obj, Playlist)) for obj in objs): raise TypeError("You can only append Tracks or Playlists to Music objects")
+        
+        with self._lock:
+            library = self._library
+            tracks = list(library.tracks)
+            playlists = list(library.playlists)
+            references = dict(library.references)
+            checksums = dict(library.checksums)
+            
+            replaced = {}
+            for obj in objs:
+                existing = references.get(obj.reference)
+                if existing is obj: continue
+                if isinstance(obj, Track):
+                    if existing is not None:
+                        # A rescanned file keeps its reference, the track with the new tags replaces the old one
+                        if not isinstance(existing, Track) or (existing.hash == obj.hash and existing.mtime == obj.mtime): continue
+                        tracks[tracks.index(existing)] = obj
+                        checksums.pop(existing.hash, None)
+                        replaced[obj.reference] = obj
+                    elif obj.hash in checksums:
+                        continue
+                    else:
+                        tracks.append(obj)
+                    checksums[obj.hash] = obj
+                else:
+                    obj = obj.loaded(references)
+                    if existing is not None:
+                        if not isinstance(existing, Playlist) or existing.references == obj.references: continue
+                        playlists[playlists.index(existing)] = obj
+                        replaced[obj.reference] = obj
+                    elif any(playlist == obj for playlist in playlists):
+                        continue
+                    else:
+                        playlists.append(obj)
+                references[obj.reference] = obj
+            
+            if not replaced and len(tracks) == len(library.tracks) and len(playlists) == len(library.playlists): return library
+            
+            # Playlists of the current snapshot are replaced rather than changed, readers of it keep their tracks
+            tracks_by_reference = {track.reference: track for track in tracks}
+            playlists = [playlist.loaded(tracks_by_reference, refresh = bool(replaced)) for playlist in playlists]
+            self._library = Library.construct(tracks, playlists, library.generation + 1)
+            return self._library
+    
     def append(self, obj : Track | Playlist):
         if not (isinstance(obj, Track) or isinstance(obj, Playlist)): raise TypeError("You can only append Tracks or Playlists to Music objects")
-        
-        if isinstance(obj, Track):
-            if any(track.reference == obj.reference for track in self.tracks): return
-            if any(track == obj for track in self.tracks): return
-            self.tracks.append(obj)
-        elif isinstance(obj, Playlist):
-            if any(playlist.reference == obj.reference for playlist in self.playlists): return
-            if any(playlist == obj for playlist in self.playlists): return
-            self.playlists.append(obj)
+        self.extend([obj])
     
     def to_dict(self) -> dict:
+        library = self._library
         return {
-            "playlists": [playlist.to_dict() for playlist in self.playlists],
-            "tracks": [track.to_dict() for track in self.tracks]
+            "playlists": [playlist.to_dict() for playlist in library.playlists],
+            "tracks": [track.to_dict() for track in library.tracks]
         }
     
     def save(self, path : str):
@@ -222,51 +486,120 @@ class Music:
         except json.decoder.JSONDecodeError:
             print("Invalid json structure, please fix manually or scan new...")
             return
-            
-        for track in data['tracks']:
-            self.append(Track.construct(track))
-            
-        for playlist in data['playlists']:
-            self.append(Playlist.construct(playlist))
-            
-        for playlist in self.playlists: 
-            playlist.load(self.tracks)
+        
+        # Built completely before it is published, readers never see a half read index
+        self.extend(
+            [Track.construct(track) for track in data['tracks']] +
+            [Playlist.construct(playlist) for playlist in data['playlists']]
+        )
     
     def merge(self, music : "Music") -> "Music":
         if not isinstance(music, Music): raise TypeError("You can only merge Music objects with other Music objects")
         
-        for track in music.tracks:
-            self.append(track)
-            
-        for playlist in music.playlists:
-            self.append(playlist)
-            
-        for playlist in self.playlists: 
-            playlist.load(self.tracks)
+        library = music.library
+        self.extend([*library.tracks, *library.playlists])
         
         return self
     
+    def load(self, path : str, finished : Callable[[], None] = None) -> threading.Thread:
+        """
+        Reads the index of ``path`` in a background thread, ``loading`` is true until it is published
+        """
+        self._loaded.clear()
+        def run():
+            try:
+                self.read(path)
+            except Exception as e:
+                print(f"Couldn't load the library of '{path}': {e}")
+            finally:
+                self._loaded.set()
+                if finished is not None: finished()
+        
+        thread = threading.Thread(target = run, name = 'music-load')
+        thread.daemon = True
+        thread.start()
+        return thread
+    
+    def rescan(self, path : str, save : bool = True) -> threading.Thread:
+        """
+        Scans ``path`` in a background thread and swaps the merged library in when done, searches keep using the old one meanwhile
+        """
+        def rebuild():
+            try:
+                self.merge(Music.scan(path, previous = self))
+                if save: self.save(path)
+            except Exception as e:
+                print(f"Couldn't scan '{path}': {e}")
+                return
+            print(f"Finished scanning '{path}', the library contains {len(self.tracks)} tracks")
+        
+        thread = threading.Thread(target = rebuild, name = 'music-scan')
+        thread.daemon = True
+        thread.start()
+        return thread
+    
+    def analyse(self, executable : str = "ffmpeg", workers : int = None, path : str = None) -> threading.Thread:
+        """
+        Measures the loudness of every track without gain in a background worker pool, saves the library to ``path`` when done
+        """
+        def run():
+            pending = [track for track in self.tracks if track.gain is None]
+            with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix = 'music-analyse') as pool:
+                futures = {pool.submit(loudness.analyse, track.path, executable): track for track in pending}
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        futures[future].gain = future.result()['gain']
+                    except Exception as e:
+                        print(f"Couldn't analyse '{futures[future].path}': {e}")
+            if path is not None: self.save(path)
+            print(f"Finished analysing {len(pending)} tracks")
+        
+        thread = threading.Thread(target = run, name = 'music-analyse')
+        thread.daemon = True
+        thread.start()
+        return thread
+    
     @staticmethod
-    def scan(path : str) -> "Music":
-        scanned_tracks = [f for f in glob.glob(f"{path}\\*.mp3")]
-        tracks = []
+    def scan(path : str, previous : "Music" = None, workers : int = None) -> "Music":
+        """
+        Reads the checksums and tags of all audio files in ``path`` in a worker pool
+        Files ``previous`` knows with the same size and modification time are reused without opening them again
+        """
+        scanned_tracks = sorted(f for extension in EXTENSIONS for f in glob.glob(os.path.join(path, f"*.{extension}")))
+        known = previous.library.paths if previous is not None else {}
+        tracks = {}
+        changed = []
         
         for track in scanned_tracks:
-            tracks.append(
-                Track(
+            try:
+                stat = os.stat(track)
+            except FileNotFoundError:
+                continue
+            if track in known and known[track].unchanged(stat):
+                tracks[track] = known[track]
+            else:
+                changed.append(track)
+        
+        with concurrent.futures.ThreadPoolExecutor(workers, thread_name_prefix = 'music-scan') as pool:
+            for track, info in zip(changed, pool.map(tags.read, changed)):
+                # Deleted, locked or unreadable files are left out of this scan
+                if info is None: continue
+                tracks[track] = Track(
                     name = os.path.splitext(os.path.basename(track))[0],
                     path = track,
                     description = "",
-                    reference = uuid.uuid4()
+                    reference = known[track].reference if track in known else uuid.uuid4(),
+                    **info
                 )
-            )
-        print(f"Detected {len(tracks)} tracks in '{path}'.")
+        tracks = [tracks[track] for track in scanned_tracks if track in tracks]
+        print(f"Detected {len(tracks)} tracks in '{path}', {len(changed)} of them new or changed.")
         
+        name = f"music of {path}"
         playlist = Playlist(
-            name = f"music of {path}",
-            description = f"This is a playlist containing all scanned .mp3 files in {path}",
+            name = name,
+            description = f"This is a playlist containing all scanned audio files in {path}",
             tracks = tracks,
-            reference = uuid.uuid4()
+            reference = previous.library.playlist_names[name].reference if previous is not None and name in previous.library.playlist_names else uuid.uuid4()
         )
             
         return Music([playlist], tracks)
\ No newline at end of file
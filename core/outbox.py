@@ -0,0 +1,133 @@
+import asyncio, collections, discord
+
+from typing import TYPE_CHECKING
+
+from core.ratelimit import TokenBucket
+
+if TYPE_CHECKING:
+    from core.client import Client
+
+
+class Outgoing:
+    """
+    A pending message of the outbox
+    """
+
+    def __init__(self, content : str, reference : discord.Message = None, coalesce : bool = True, **kwargs):
+        self.content : str = None if content is None else str(content)
+        self.reference : discord.Message = reference
+        self.kwargs : dict = kwargs
+        self.coalesce : bool = coalesce and not kwargs and self.content is not None
+        self.future : asyncio.Future = asyncio.get_event_loop().create_future()
+        # Fire and forget callers never retrieve errors, they are printed on delivery instead
+        self.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+
+
+class Outbox:
+    """
+    Queues outgoing messages per channel, merges pending short messages and paces them ahead of discord's rate limits
+    """
+
+    def __init__(self, client : "Client", max_in_flight : int = 10, rate : int = 5, per : float = 5.0, max_length : int = 2000):
+        self._client : "Client" = client
+        self._rate : int = rate
+        self._per : float = per
+        self._max_length : int = max_length
+        self._max_in_flight : int = max_in_flight
+        self._in_flight : asyncio.Semaphore = None
+        self._queues : dict[int, collections.deque[Outgoing]] = {}
+        self._buckets : dict[int, TokenBucket] = {}
+        self._typing : set[int] = set()
+        self.sent : int = 0
+        self.merged : int = 0
+        self.failed : int = 0
+
+    @property
+    def client(self) -> "Client":
+        return self._client
+
+    @property
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def send(self, channel : discord.abc.Messageable, content : str = None, *, reference : discord.Message = None, coalesce : bool = True, **kwargs) -> asyncio.Future:
+        """
+        Queues a message for ``channel`` and returns a future of the sent ``discord.Message``, awaiting it is optional
+        """
+        outgoing = Outgoing(content, reference = reference, coalesce = coalesce, **kwargs)
+
+        if channel.id not in self._queues:
+            self._queues[channel.id] = collections.deque()
+            self._queues[channel.id].append(outgoing)
+            asyncio.ensure_future(self._drain(channel))
+        else:
+            self._queues[channel.id].append(outgoing)
+
+        return outgoing.future
+
+    def reply(self, message : discord.Message, content : str = None, **kwargs) -> asyncio.Future:
+        return self.send(message.channel, content, reference = message, **kwargs)
+
+    def typing(self, channel : discord.abc.Messageable) -> None:
+        """
+        Triggers typing without waiting, skipped while a typing request for the channel is still in flight
+        """
+        if channel.id in self._typing: return
+        self._typing.add(channel.id)
+        asyncio.ensure_future(self._trigger_typing(channel))
+
+    async def _trigger_typing(self, channel : discord.abc.Messageable) -> None:
+        try:
+            await channel.trigger_typing()
+        except discord.HTTPException:
+            pass
+        finally:
+            self._typing.discard(channel.id)
+
+    def _take(self, queue : collections.deque[Outgoing]) -> list[Outgoing]:
+        batch = [queue.popleft()]
+        if not batch[0].coalesce: return batch
+
+        # Only messages replying to the same message (or all to none) are merged, so no reply loses its target
+        reference = getattr(batch[0].reference, 'id', None)
+        length = len(batch[0].content)
+        while queue and queue[0].coalesce and getattr(queue[0].reference, 'id', None) == reference and length + 1 + len(queue[0].content) <= self._max_length:
+            length += 1 + len(queue[0].content)
+            batch.append(queue.popleft())
+        return batch
+
+    async def _drain(self, channel : discord.abc.Messageable) -> None:
+        if self._in_flight is None: self._in_flight = asyncio.Semaphore(self._max_in_flight)
+        queue = self._queues[channel.id]
+        bucket = self._buckets.setdefault(channel.id, TokenBucket(self._rate, self._per))
+
+        try:
+            while queue:
+                # Wait for the channel bucket instead of running into a 429, messages queued meanwhile get merged
+                delay = bucket.delay()
+                if delay > 0: await asyncio.sleep(delay)
+                bucket.consume()
+
+                batch = self._take(queue)
+                async with self._in_flight:
+                    await self._deliver(channel, batch)
+        finally:
+            del self._queues[channel.id]
+            if bucket.full: del self._buckets[channel.id]
+
+    async def _deliver(self, channel : discord.abc.Messageable, batch : list[Outgoing]) -> None:
+        first = batch[0]
+        content = '\n'.join(outgoing.content for outgoing in batch) if len(batch) > 1 else first.content
+        try:
+            message = await channel.send(content, reference = first.reference, **first.kwargs)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f'Failed to send message to channel {channel.id}: {e}')
+            for outgoing in batch:
+                if not outgoing.future.done(): outgoing.future.set_exception(e)
+            return
+
+        self.sent += 1
+        self.merged += len(batch) - 1
+        for outgoing in batch:
+            if not outgoing.future.done(): outgoing.future.set_result(message)
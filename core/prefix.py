@@ -0,0 +1,55 @@
+import discord
+
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from core.client import Client
+
+
+class Prefixes:
+    """
+    Per server and per channel command prefixes, cached per server and falling back to the configured prefix
+    """
+    
+    def __init__(self, client : "Client"):
+        self._client : "Client" = client
+        # server id -> (server prefix or None, channel id -> channel prefix)
+        self._servers : dict[int, tuple[str, dict[int, str]]] = {}
+        
+    @property
+    def client(self) -> "Client":
+        return self._client
+    
+    def _load(self, server_id : int) -> tuple[str, dict[int, str]]:
+        prefixes = self.client.database.read_prefixes(server_id)
+        entry = (prefixes.pop(0, None), prefixes)
+        self._servers[server_id] = entry
+        return entry
+    
+    def resolve(self, server_id : int, channel_id : int = None) -> str:
+        entry = self._servers.get(server_id) or self._load(server_id)
+        prefix = entry[1].get(channel_id, entry[0]) if entry[1] else entry[0]
+        return prefix if prefix is not None else self.client.config.snapshot.prefix
+    
+    def match(self, message : discord.Message) -> str:
+        """
+        Returns the prefix the message starts with, or ``None`` if it isn't a command
+        """
+        if message.guild is None:
+            prefix = self.client.config.snapshot.prefix
+        else:
+            prefix = self.resolve(message.guild.id, message.channel.id)
+        return prefix if message.content.startswith(prefix) else None
+    
+    def set(self, server_id : int, prefix : str, channel_id : int = None) -> None:
+        if not isinstance(prefix, str) or prefix == "" or ' ' in prefix: raise ValueError('Please use a non empty prefix without spaces.')
+        
+        self.client.database.update_prefix(server_id, channel_id or 0, prefix)
+        self.invalidate(server_id)
+    
+    def reset(self, server_id : int, channel_id : int = None) -> None:
+        self.client.database.delete_prefix(server_id, channel_id or 0)
+        self.invalidate(server_id)
+        
+    def invalidate(self, server_id : int) -> None:
+        self._servers.pop(server_id, None)
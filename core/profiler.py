@@ -0,0 +1,149 @@
+import asyncio, collections, os, sys, threading, time, traceback
+
+
+def _collapse(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class LagMonitor:
+    """
+    Watchdog which logs the stack of the event loop thread whenever the loop is blocked longer than ``threshold`` seconds
+    """
+
+    def __init__(self, threshold : float = 0.25, interval : float = 0.05):
+        self.threshold : float = threshold
+        self._interval : float = interval
+        self._loop : asyncio.AbstractEventLoop = None
+        self._loop_thread : int = None
+        self._heartbeat : float = time.monotonic()
+        self._lag : float = 0.0
+        self._max_lag : float = 0.0
+        self._stalls : int = 0
+        self._running : bool = False
+        # Bumped on every start, a heartbeat or watchdog of an earlier start ends once it sees a newer one
+        self._generation : int = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    @property
+    def lag(self) -> float:
+        """
+        Lag of the last heartbeat, or the duration of the ongoing stall
+        """
+        return max(self._lag, time.monotonic() - self._heartbeat - self._interval)
+
+    @property
+    def max_lag(self) -> float:
+        return self._max_lag
+
+    @property
+    def stalls(self) -> int:
+        return self._stalls
+
+    def start(self, loop : asyncio.AbstractEventLoop) -> "LagMonitor":
+        if self.running: raise RuntimeError('The lag monitor is already running!')
+
+        self._running = True
+        self._generation += 1
+        self._loop = loop
+        self._heartbeat = time.monotonic()
+        asyncio.run_coroutine_threadsafe(self._beat(self._generation), loop)
+
+        watchdog = threading.Thread(target = self._watch, args = (self._generation,), name = 'lag-monitor')
+        watchdog.daemon = True
+        watchdog.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+
+    def _current(self, generation : int) -> bool:
+        return self._running and self._generation == generation
+
+    async def _beat(self, generation : int) -> None:
+        self._loop_thread = threading.get_ident()
+        while self._current(generation):
+            before = time.monotonic()
+            self._heartbeat = before
+            await asyncio.sleep(self._interval)
+            self._lag = max(time.monotonic() - before - self._interval, 0.0)
+            self._max_lag = max(self._max_lag, self._lag)
+
+    def _watch(self, generation : int) -> None:
+        reported = None
+        while self._current(generation):
+            time.sleep(self._interval)
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self._interval
+
+            if stalled > self.threshold and reported != heartbeat and self._loop_thread is not None:
+                # Only report a stall once, the stack is taken while the loop is still blocked
+                reported = heartbeat
+                self._stalls += 1
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = ''.join(traceback.format_stack(frame)) if frame is not None else 'no stack available\n'
+                print(f'Event loop blocked for more than {stalled * 1000:.0f}ms, current stack:\n{stack}', end = '')
+            elif reported is not None and reported != heartbeat:
+                print(f'Event loop recovered after {self._lag * 1000:.0f}ms')
+                reported = None
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads and writes them as collapsed stacks, which can be rendered as a flamegraph
+    """
+
+    def __init__(self, interval : float = 0.005):
+        self._interval : float = interval
+        self._samples : collections.Counter = collections.Counter()
+        self._thread : threading.Thread = None
+        self._stop : threading.Event = threading.Event()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def samples(self) -> collections.Counter:
+        return self._samples
+
+    def start(self, duration : float, path : str = None) -> threading.Thread:
+        if self.running: raise RuntimeError('The profiler is already running!')
+
+        self._samples = collections.Counter()
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._sample, args = (duration, path), name = 'sampling-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _sample(self, duration : float, path : str) -> None:
+        own = threading.get_ident()
+        names = {}
+        end = time.monotonic() + duration
+        while time.monotonic() < end and not self._stop.is_set():
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own: continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                self._samples[f'{names.get(thread_id, thread_id)};{_collapse(frame)}'] += 1
+            self._stop.wait(self._interval)
+
+        if path is not None:
+            self.write(path)
+            print(f'Profile with {sum(self._samples.values())} samples written to {path}')
+
+    def write(self, path : str) -> None:
+        with open(path, 'w') as outfile:
+            for stack, count in self._samples.most_common():
+                outfile.write(f'{stack} {count}\n')
@@ -0,0 +1,158 @@
+import asyncio, discord, time
+
+from typing import TYPE_CHECKING
+
+from core.enums import Bucket
+
+if TYPE_CHECKING:
+    from core.client import Client
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` actions per ``per`` seconds, with bursts of up to ``burst`` actions
+    """
+
+    def __init__(self, rate : int, per : float, burst : int = None):
+        self.capacity : int = burst or rate
+        self.refill : float = rate / per
+        self.tokens : float = self.capacity
+        self.updated : float = time.monotonic()
+        self.notified : bool = False
+
+    def _update(self, now : float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill)
+        self.updated = now
+
+    @property
+    def full(self) -> bool:
+        self._update(time.monotonic())
+        return self.tokens >= self.capacity
+
+    def delay(self, amount : int = 1) -> float:
+        """
+        Seconds until ``amount`` tokens are available
+        """
+        self._update(time.monotonic())
+        return max(0.0, (amount - self.tokens) / self.refill)
+
+    def consume(self, amount : int = 1) -> bool:
+        self._update(time.monotonic())
+        if self.tokens < amount: return False
+        self.tokens -= amount
+        return True
+
+
+class Cooldown:
+    """
+    Declares that a command may be used ``rate`` times per ``per`` seconds in each ``bucket``, with bursts of up to ``burst``
+    """
+
+    def __init__(self, rate : int, per : float, bucket : Bucket = Bucket.USER, burst : int = None):
+        if rate <= 0 or per <= 0: raise ValueError('A cooldown needs a positive rate and period')
+
+        self.rate : int = rate
+        self.per : float = per
+        self.bucket : Bucket = Bucket.convert(bucket)
+        self.burst : int = burst
+
+    def key(self, message : discord.Message) -> int:
+        match self.bucket:
+            case Bucket.USER:
+                return message.author.id
+            case Bucket.CHANNEL:
+                return message.channel.id
+            case Bucket.GUILD:
+                return message.guild.id if message.guild is not None else message.channel.id
+            case Bucket.GLOBAL:
+                return 0
+
+
+class Cooldowns:
+    """
+    Token buckets of all cooldowns, buckets which refilled completely are dropped by a periodic sweep on the event loop
+    """
+
+    def __init__(self, sweep_interval : float = 60.0):
+        self._buckets : dict[tuple[int, int], TokenBucket] = {}
+        self._sweep_interval : float = sweep_interval
+        self._sweeper : asyncio.Future = None
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    @property
+    def running(self) -> bool:
+        return self._sweeper is not None and not self._sweeper.done()
+
+    def start(self) -> None:
+        """
+        Starts sweeping every ``sweep_interval`` seconds, must be called from the event loop
+        """
+        if self.running: return
+        self._sweeper = asyncio.ensure_future(self._sweep_loop())
+
+    def stop(self) -> None:
+        if self._sweeper is not None: self._sweeper.cancel()
+        self._sweeper = None
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            self.sweep()
+
+    def hit(self, cooldown : Cooldown, message : discord.Message) -> TokenBucket:
+        """
+        Takes a token for ``message``, returns the exhausted bucket if it is on cooldown, otherwise ``None``
+        """
+        key = (id(cooldown), cooldown.key(message))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(cooldown.rate, cooldown.per, cooldown.burst)
+        if bucket.consume():
+            bucket.notified = False
+            return None
+        return bucket
+
+    def sweep(self) -> int:
+        expired = [key for key, bucket in self._buckets.items() if bucket.full]
+        for key in expired:
+            del self._buckets[key]
+        return len(expired)
+
+
+class LoadShedder:
+    """
+    Rejects commands which need no permission while the event loop lags or too much work is queued
+    """
+
+    def __init__(self, client : "Client", max_lag : float = 0.5, max_queue : int = 1000, interval : float = 0.1):
+        self._client : "Client" = client
+        self.max_lag : float = max_lag
+        self.max_queue : int = max_queue
+        self._interval : float = interval
+        self._checked : float = 0.0
+        self._shedding : bool = False
+        self.shed : int = 0
+
+    @property
+    def client(self) -> "Client":
+        return self._client
+
+    @property
+    def depth(self) -> int:
+        scheduler = self.client.events.scheduler
+        return self.client.outbox.pending + (scheduler.depth if scheduler is not None else 0)
+
+    @property
+    def shedding(self) -> bool:
+        # Reevaluated at most every ``interval`` seconds, so the check stays cheap under load
+        now = time.monotonic()
+        if now - self._checked > self._interval:
+            self._checked = now
+            # Without a running heartbeat the lag only measures the time since the monitor stopped or never started
+            monitor = self.client.lag_monitor
+            shedding = (monitor.running and monitor.lag > self.max_lag) or self.depth > self.max_queue
+            if shedding != self._shedding: print(f'{"Started" if shedding else "Stopped"} shedding load (lag {monitor.lag * 1000 if monitor.running else 0:.0f}ms, queue depth {self.depth})')
+            self._shedding = shedding
+        return self._shedding
@@ -0,0 +1,90 @@
+import discord
+
+from typing import TYPE_CHECKING, Union
+
+from core.enums import Auth
+
+if TYPE_CHECKING:
+    from core.client import Client
+
+
+def _role_ids(member : discord.Member) -> tuple[int]:
+    return tuple(sorted(role.id for role in member.roles))
+
+
+class Roles:
+    """
+    Grants permissions by discord role per server, effective permissions are cached per member and its current roles
+    """
+    
+    def __init__(self, client : "Client"):
+        self._client : "Client" = client
+        # server id -> role id -> permission
+        self._servers : dict[int, dict[int, Auth]] = {}
+        # server id -> member id -> (role ids, effective permission)
+        self._effective : dict[int, dict[int, tuple[tuple[int], Auth]]] = {}
+        
+    @property
+    def client(self) -> "Client":
+        return self._client
+    
+    def mapping(self, server_id : int) -> dict[int, Auth]:
+        mapping = self._servers.get(server_id)
+        if mapping is None: mapping = self._servers[server_id] = self.client.database.read_roles(server_id)
+        return mapping
+    
+    def permission(self, author : Union[discord.Member, discord.User]) -> Auth:
+        """
+        Highest permission of the member, its roles and the user, without database access once cached
+        """
+        guild = getattr(author, 'guild', None)
+        if guild is None: return self.client.retrieve_user(author.id).permission
+        
+        # The author of an event carries its current roles, so removed roles apply even without member update events
+        role_ids = _role_ids(author)
+        cached = self._effective.get(guild.id, {}).get(author.id)
+        if cached is not None and cached[0] == role_ids: return cached[1]
+        
+        permission = self.client.retrieve_server(guild.id).retrieve_member(author.id).permission
+        mapping = self.mapping(guild.id)
+        if mapping:
+            for role in author.roles:
+                granted = mapping.get(role.id)
+                if granted is not None and granted.value > permission.value: permission = granted
+        
+        self._effective.setdefault(guild.id, {})[author.id] = (role_ids, permission)
+        return permission
+    
+    def has_permission(self, author : Union[discord.Member, discord.User], permission : Auth) -> bool:
+        return self.permission(author).value >= permission.value
+    
+    def set(self, server_id : int, role_id : int, permission : Auth) -> None:
+        permission = Auth.convert(permission)
+        if permission == Auth.DEFAULT:
+            self.reset(server_id, role_id)
+            return
+        
+        self.client.database.update_role(server_id, role_id, permission)
+        self.mapping(server_id)[role_id] = permission
+        self.invalidate(server_id)
+    
+    def reset(self, server_id : int, role_id : int) -> None:
+        self.client.database.delete_role(server_id, role_id)
+        if self.mapping(server_id).pop(role_id, None) is not None: self.invalidate(server_id)
+    
+    def invalidate(self, server_id : int = None, member_id : int = None) -> None:
+        """
+        Forgets effective permissions of a member, a server or everything
+        """
+        if server_id is None:
+            self._effective.clear()
+        elif member_id is None:
+            self._effective.pop(server_id, None)
+        elif server_id in self._effective:
+            self._effective[server_id].pop(member_id, None)
+    
+    def member_updated(self, before : discord.Member, after : discord.Member) -> None:
+        if before.roles != after.roles: self.invalidate(after.guild.id, after.id)
+    
+    def role_deleted(self, role : discord.Role) -> None:
+        if role.id in self.mapping(role.guild.id): self.reset(role.guild.id, role.id)
@@ -10,6 +10,8 @@ class Server:
     def __init__(self, client : "Client", server_id : int):
         self._client : "Client" = client
         self._members : list[Member] = []
+        # Index of the members by id, so a lookup doesn't scan the whole server
+        self._members_by_id : dict[int, Member] = {}
         self._id : int = server_id
         
     @property
@@ -46,12 +48,13 @@ class Server:
                 permission = database_entry['permission']
             )
         self.members.append(member)
+        self._members_by_id[member_id] = member
         return member
 
     def retrieve_member(self, member_id : int) -> Member:
         if member_id == 0 or member_id == None: raise ValueError("Please provide a valid member id")
-        for member in self.members:
-            if member.id == member_id: return member
+        member = self._members_by_id.get(member_id)
+        if member is not None: return member
             
         #print("Couldn't retrieve member from current session, creating new member instance")
         return self.new_member(member_id)
\ No newline at end of file
@@ -0,0 +1,49 @@
+import hashlib, os
+
+try:
+    import mutagen
+except ImportError:
+    # Without mutagen tracks are only known by their file name
+    mutagen = None
+
+
+# Anything a single file can fail with, a scan skips such files instead of aborting
+ERRORS : tuple[type[Exception]] = (OSError, ValueError) + ((mutagen.MutagenError,) if mutagen is not None else ())
+
+
+def read(path : str) -> dict:
+    """
+    Checksum, size, modification time, duration and the artist, album and title tags of an audio file, ``None`` if it can't be read
+    Runs in the worker pool of a scan, so everything is read from the file in one go
+    """
+    try:
+        return _read(path)
+    except ERRORS as e:
+        print(f"Couldn't read '{path}': {e}")
+        return None
+
+
+def _read(path : str) -> dict:
+    stat = os.stat(path)
+    hash_md5 = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            hash_md5.update(chunk)
+
+    info = dict(checksum = hash_md5.hexdigest(), size = stat.st_size, mtime = stat.st_mtime_ns, duration = None, artist = None, album = None, title = None)
+    if mutagen is None: return info
+
+    try:
+        # easy tags map ID3 frames and vorbis comments to the same keys
+        audio = mutagen.File(path, easy = True)
+    except ERRORS as e:
+        # The file itself is fine, it is still known by its name
+        print(f"Couldn't read the tags of '{path}': {e}")
+        return info
+    if audio is None: return info
+
+    if audio.info is not None: info['duration'] = audio.info.length
+    for key in ('artist', 'album', 'title'):
+        values = audio.get(key) if audio.tags is not None else None
+        if values: info[key] = str(values[0])
+    return info
@@ -5,6 +5,9 @@ class User:
     The global object of a discord user
     """
     
+    # Without an instance dict, there is one of these for every user the bot has seen
+    __slots__ = ('_id', '_permission')
+    
     def __init__(self, user_id : int, permission : Auth = Auth.DEFAULT):
         self._id : int = user_id
         self._permission : Auth = permission
@@ -1,116 +1,196 @@
-import discord, random
+import discord, os, random
+from core.audio_receiver import RecordingSink, SelectiveSink
 from core.config import Configuration
 from core.client import Client
 from core.console import Console
-from core.enums import Auth, Event, Restriction
-from core.music import Music
+from core.enums import Auth, Bucket, Event, Restriction
+from core.metrics import Timeline
+from core.ratelimit import Cooldown
 
-client = Client(
-    config = Configuration(),
-    music_path = ".music"
-)
+def setup(cls : type[Client] = Client, **options) -> tuple[Client, Console]:
+    timeline = Timeline()
+    with timeline.phase('config'):
+        config = Configuration()
+    client = cls(
+        config = config,
+        music_path = ".music",
+        timeline = timeline,
+        **options
+    )
 
-@client.react(Event.ON_COMMAND, 'ping', permission = Auth.DEFAULT)
-async def test_command(message, *args):
-    await message.channel.send('Pong!')
-    
-@client.react(Event.ON_COMMAND, 'test', permission = Auth.OWNER)
-async def test2_command(message, *args):
-    await message.channel.send('Seems like you have atleast owner permission.')
-    
-@client.react(Event.ON_COMMAND, 'set', permission = Auth.DEFAULT)
-async def test3_command(message, *args):
-    try:
-        auth = Auth.convert(message.content.split(' ')[1])
-    except ValueError as e:
-        await message.reply(e)
-        return
-    client.retrieve_server(message.guild.id).retrieve_member(message.author.id).permission = auth
-    await message.reply(f"Successfully changed your server permission to {auth}")
-    
-@client.react(Event.ON_COMMAND, 'nsfw', restriction = Restriction.NSFW)
-async def test4_command(message, *args):
-    await message.channel.send('Seems like this is a nsfw channel.')
-    
-# @client.react(Event.ON_MESSAGE, after_command = True)
-# async def test5_on_message(message):
-#     await message.channel.trigger_typing()
-#     await message.channel.send('This was triggered after command')
-# 
-# @client.react(Event.ON_MESSAGE)
-# async def test6_on_message(message):
-#     await message.channel.trigger_typing()
-#     await message.channel.send('This was triggered before command')
-    
-@client.react(Event.ON_REACTION_ADD)
-async def test7_on_reaction_add(reaction, user):
-    await reaction.message.reply(f'{user.mention} reacted to this message')
-    
-# @client.react(Event.ON_REACTION_REMOVE)
-# async def test8_on_reaction_remove(reaction, user):
-#     await reaction.message.reply(f'{user.mention} removed his reacton from this message')
-
-@client.react(Event.ON_COMMAND, "latency")
-async def current_latency(message : discord.Message, *args):
-    await message.reply(f"Current ping is {round(client.latency, 1)}")
-
-@client.react(Event.ON_COMMAND, "join")
-async def join_voice(message : discord.Message, *args):
-    voice_channel : discord.VoiceChannel = message.author.voice
-    if voice_channel is not None:
-        vc = await voice_channel.connect()
-        vc.listen(client._audio_sink)
-        await message.channel.send(f"I'm now listening to {voice_channel.name}")
-
-@client.react(Event.ON_COMMAND, "leave", requires_voice = True)
-async def join_voice(message : discord.Message, *args):
-    voice_channel = message.guild.voice_client.channel
-    vc = message.guild.voice_client
-    vc.stop()
-    vc.stop_listening()
-    await vc.disconnect()
-    await message.channel.send(f"I'm no longer listening to {voice_channel.name}")
-
-@client.react(Event.ON_COMMAND, "record", requires_voice = True)
-async def start_record(message, *args):
-    vc : discord.VoiceClient = await message.author.voice.channel.connect() # Connect to the voice channel of the author
-    vc.start_recording(discord.sinks.MP3Sink(), finished_callback, ctx) # Start the recording
-    vc.average_latency()
-    await message.reply("Recording...")
-
-@client.react(Event.ON_COMMAND, "play")
-async def test_music_command(message, *args):
-    # Gets voice channel of message author
-    arg = ' '.join(args)
-    await message.reply(f"Searching for '{arg}'")
-    await message.channel.trigger_typing()
-    voice_channel = message.author.voice
-    channel = None
-    if voice_channel is not None:
-        vc = await voice_channel.channel.connect()
-        track = client.music.search_track(arg)
-        await message.channel.send(f"Now playing '{track.name}'")
-        vc.play(discord.FFmpegPCMAudio(executable = "ffmpeg.exe", source = track.path))
-        # Sleep while audio is playing.
-        # while vc.is_playing():
-        #     sleep(.1)
-        # await vc.disconnect()
-    else:
-        await message.reply("You are not in a voice channel.")
-
-console = Console()
-
-@console.func('scan')
-def test_console(path):
-    client.music.merge(Music.scan(path))
-    client.music.save(path)
+    @client.react(Event.ON_COMMAND, 'ping', permission = Auth.DEFAULT, cooldown = Cooldown(5, 10.0, Bucket.USER))
+    async def test_command(message, *args):
+        client.outbox.send(message.channel, 'Pong!')
+
+    @client.react(Event.ON_COMMAND, 'test', permission = Auth.OWNER)
+    async def test2_command(message, *args):
+        client.outbox.send(message.channel, 'Seems like you have atleast owner permission.')
+
+    @client.react(Event.ON_COMMAND, 'set', permission = Auth.DEFAULT)
+    async def test3_command(message, *args):
+        try:
+            auth = Auth.convert(message.content.split(' ')[1])
+        except ValueError as e:
+            await message.reply(e)
+            return
+        client.retrieve_server(message.guild.id).retrieve_member(message.author.id).permission = auth
+        await message.reply(f"Successfully changed your server permission to {auth}")
+
+    @client.react(Event.ON_COMMAND, 'nsfw', restriction = Restriction.NSFW)
+    async def test4_command(message, *args):
+        client.outbox.send(message.channel, 'Seems like this is a nsfw channel.')
+
+    # @client.react(Event.ON_MESSAGE, after_command = True)
+    # async def test5_on_message(message):
+    #     await message.channel.trigger_typing()
+    #     await message.channel.send('This was triggered after command')
+    # 
+    # @client.react(Event.ON_MESSAGE)
+    # async def test6_on_message(message):
+    #     await message.channel.trigger_typing()
+    #     await message.channel.send('This was triggered before command')
+
+    @client.react(Event.ON_REACTION_ADD)
+    async def test7_on_reaction_add(payload):
+        # Raw events also arrive for channels that aren't cached, like DMs
+        channel = client.get_channel(payload.channel_id)
+        if channel is None:
+            try:
+                channel = await client.fetch_channel(payload.channel_id)
+            except discord.HTTPException:
+                return
+        client.outbox.send(channel, f'<@{payload.user_id}> reacted with {payload.emoji}')
+
+    # @client.react(Event.ON_REACTION_REMOVE, emoji = '👍')
+    # async def test8_on_reaction_remove(payload):
+    #     client.outbox.send(client.get_channel(payload.channel_id), f'<@{payload.user_id}> removed their thumbs up')
+
+    @client.react(Event.ON_COMMAND, "latency")
+    async def current_latency(message : discord.Message, *args):
+        client.outbox.reply(message, f"Current ping is {round(client.latency, 1)}")
+
+    @client.react(Event.ON_COMMAND, "join", cooldown = Cooldown(2, 30.0, Bucket.GUILD))
+    async def join_voice(message : discord.Message, *args):
+        voice_channel : discord.VoiceChannel = message.author.voice
+        if voice_channel is not None:
+            vc = await voice_channel.connect()
+            vc.listen(client.audio_sink(message.guild.id))
+            await message.channel.send(f"I'm now listening to {voice_channel.name}")
+
+    @client.react(Event.ON_COMMAND, "transcribe")
+    async def opt_in_transcription(message : discord.Message, state = "on", *args):
+        # Only speakers who opted in are decoded and transcribed, separately in every server
+        if message.guild is None:
+            client.outbox.reply(message, "Voice can only be transcribed in a server.")
+        elif state == "off":
+            client.audio_sink(message.guild.id).unsubscribe(message.author.id)
+            client.outbox.reply(message, "Your voice is no longer transcribed.")
+        else:
+            client.audio_sink(message.guild.id).subscribe(message.author.id)
+            client.outbox.reply(message, "Your voice is transcribed from now on, use ``transcribe off`` to stop.")
+
+    @client.react(Event.ON_COMMAND, "leave", requires_voice = True)
+    async def join_voice(message : discord.Message, *args):
+        voice_channel = message.guild.voice_client.channel
+        vc = message.guild.voice_client
+        client.mixers.stop(message.guild.id)
+        vc.stop()
+        vc.stop_listening()
+        await vc.disconnect()
+        await message.channel.send(f"I'm no longer listening to {voice_channel.name}")
+
+    @client.react(Event.ON_COMMAND, "record", cooldown = Cooldown(2, 60.0, Bucket.GUILD))
+    async def start_record(message, seconds = "300", *args):
+        # Mentioned members are recorded, without mentions everyone in the channel
+        vc : discord.VoiceClient = message.guild.voice_client
+        if seconds == "stop":
+            if vc is not None and vc.is_listening(): vc.stop_listening()
+            return
+        try:
+            seconds = float(seconds)
+        except ValueError:
+            client.outbox.reply(message, "Please give the length of the recording in seconds, or ``stop``.")
+            return
+        if message.author.voice is None:
+            client.outbox.reply(message, "You are not in a voice channel.")
+            return
+        if vc is None: vc = await message.author.voice.channel.connect() # Connect to the voice channel of the author
+        if vc.is_listening(): vc.stop_listening()
+
+        def finished(sink):
+            # Called from the writer thread of the sink
+            def report():
+                if vc.is_listening(): vc.stop_listening()
+                client.outbox.reply(message, f"Finished recording {len(sink.files)} speakers to ``{sink.directory}``, decoded {selective.decoded} frames and skipped {selective.skipped}{f', dropped {sink.dropped} frames' if sink.dropped else ''}")
+            client.loop.call_soon_threadsafe(report)
+
+        selective = SelectiveSink(RecordingSink(os.path.join(".recordings", str(message.id)), max_seconds = seconds, finished = finished), speakers = [member.id for member in message.mentions] or None)
+        vc.listen(selective) # Start the recording
+        client.outbox.reply(message, f"Recording for up to {seconds:.0f} seconds...")
+
+    @client.react(Event.ON_COMMAND, "sound", cooldown = Cooldown(5, 10.0, Bucket.USER))
+    async def play_clip(message, name = None, *args):
+        if name not in client.clips:
+            client.outbox.reply(message, f"Available sounds: {', '.join(client.clips.names) or 'none'}")
+            return
+        if message.author.voice is None:
+            client.outbox.reply(message, "You are not in a voice channel.")
+            return
+        vc = message.guild.voice_client or await message.author.voice.channel.connect()
+        # Read from a shared memory map, no ffmpeg process is started
+        client.mixers.play(vc, client.clips.source(name))
+
+    @client.react(Event.ON_COMMAND, "play", requires_library = True, cooldown = Cooldown(3, 30.0, Bucket.USER))
+    async def test_music_command(message, *args):
+        # Gets voice channel of message author
+        arg = ' '.join(args)
+        await message.reply(f"Searching for '{arg}'")
+        await message.channel.trigger_typing()
+        voice_channel = message.author.voice
+        channel = None
+        if voice_channel is not None:
+            vc = message.guild.voice_client or await voice_channel.channel.connect()
+            # A new query is matched off the event loop, it compares against every track
+            track = await client.music.find_track(arg, client.executors)
+            if track is None:
+                await message.reply("There is no track to play, give a title to search for.")
+                return
+            await message.channel.send(f"Now playing '{track.name}'")
+            # Mixed into whatever the server already plays, normalized with the gain of the loudness analysis
+            client.mixers.play(vc, discord.FFmpegPCMAudio(executable = "ffmpeg.exe", source = track.path), track.gain)
+            # Sleep while audio is playing.
+            # while vc.is_playing():
+            #     sleep(.1)
+            # await vc.disconnect()
+        else:
+            await message.reply("You are not in a voice channel.")
+
+    console = Console()
+
+    @console.func('scan')
+    def test_console(path):
+        # Every worker of a cluster needs the new tracks, but only the first one writes the index
+        client.music.rescan(path, save = client.worker == 0)
+
+    @console.func('clip', once = True)
+    def add_clip(name, path):
+        print(f"Added clip '{name}' as {client.clips.add(name, path, executable = 'ffmpeg.exe')}")
+
+    @console.func('analyse', once = True)
+    def analyse_console(path):
+        client.music.analyse(executable = "ffmpeg.exe", path = path)
+
+    @console.func('test2')
+    async def test_async_console(*args):
+        game = discord.Game(' '.join(args))
+        await client.change_presence(activity = game)
     
-@console.func('test2')
-async def test_async_console(*args):
-    game = discord.Game(' '.join(args))
-    await client.change_presence(activity = game)
+    return client, console
+
+if __name__ == '__main__':
+    client, console = setup()
+    client.run(access_console = console)
 
-client.run(access_console = console)
 
 # client.run(threaded = True)
 # 